@@ -1,15 +1,32 @@
 import streamlit as st
-from langchain_groq import ChatGroq
-from langchain_classic.chains import ConversationChain
-from langchain_classic.memory import ConversationBufferMemory
+from streamlit.errors import StreamlitAPIException
+import json
 import os
+import logging
+import re
+import time
 from dotenv import load_dotenv
-import json
-from datetime import datetime, timedelta
-import hashlib
+from datetime import datetime
 
 load_dotenv()
 
+# Local modules read their settings from the environment, so import them after .env is loaded.
+# The LLM stack (LangChain, the Groq client, chat memory, retrieval) is imported
+# where it is first used, so the login page never loads it.
+from auth import AuthBusy, create_session_token, verify_session_token  # noqa: E402
+from chat_render import RenderCache, window_start  # noqa: E402
+from database import create_database  # noqa: E402
+from ingestion import Ingestor  # noqa: E402
+from llm_scheduler import RequestScheduler, SchedulerBusy  # noqa: E402
+from model_router import ModelRouter, is_fallback_error  # noqa: E402
+from response_cache import FastPathRegistry, ResponseCache, conversation_cache_key  # noqa: E402
+from retention import ColdArchive, start_background_retention  # noqa: E402
+from streaming import StreamedReply, complete_reply  # noqa: E402
+import tracing  # noqa: E402
+from tracing import span, traced  # noqa: E402
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+
 # Page configuration
 st.set_page_config(
     page_title="Iyyappan AI ",
@@ -18,128 +35,63 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Database simulation 
-class UserDatabase:
-    def __init__(self):
-        self.users_file = "users_data.json"
-        self.conversations_file = "conversations_data.json"
-        self.context_file = "user_context.json"
-        
-    def load_data(self, filename):
-        try:
-            with open(filename, 'r') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
-    
-    def save_data(self, filename, data):
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=2)
-    
-    def hash_password(self, password):
-        return hashlib.sha256(password.encode()).hexdigest()
-    
-    def verify_user(self, username, password):
-        users = self.load_data(self.users_file)
-        if username in users:
-            return users[username]['password'] == self.hash_password(password)
-        return False
-    
-    def create_user(self, username, password):
-        users = self.load_data(self.users_file)
-        if username in users:
-            return False
-        users[username] = {
-            'password': self.hash_password(password),
-            'created_at': datetime.now().isoformat(),
-            'preferences': {
-                'model': 'llama-3.3-70b-versatile',
-                'temperature': 0.7,
-                'theme': 'light'
-            }
-        }
-        self.save_data(self.users_file, users)
-        return True
-    
-    def get_user_conversations(self, username):
-        conversations = self.load_data(self.conversations_file)
-        user_convs = conversations.get(username, [])
-        # Filter conversations from last 7 days
-        seven_days_ago = datetime.now() - timedelta(days=7)
-        filtered_convs = [
-            conv for conv in user_convs 
-            if datetime.fromisoformat(conv['created_at']) > seven_days_ago
-        ]
-        return filtered_convs
-    
-    def save_conversation(self, username, conv_id, messages, title="New Chat"):
-        conversations = self.load_data(self.conversations_file)
-        if username not in conversations:
-            conversations[username] = []
-        
-        # Update existing or create new
-        existing = next((c for c in conversations[username] if c['id'] == conv_id), None)
-        if existing:
-            existing['messages'] = messages
-            existing['updated_at'] = datetime.now().isoformat()
-        else:
-            conversations[username].append({
-                'id': conv_id,
-                'title': title,
-                'messages': messages,
-                'created_at': datetime.now().isoformat(),
-                'updated_at': datetime.now().isoformat()
-            })
-        
-        self.save_data(self.conversations_file, conversations)
-    
-    def delete_conversation(self, username, conv_id):
-        conversations = self.load_data(self.conversations_file)
-        if username in conversations:
-            conversations[username] = [c for c in conversations[username] if c['id'] != conv_id]
-            self.save_data(self.conversations_file, conversations)
-    
-    def get_user_context(self, username):
-        context_data = self.load_data(self.context_file)
-        return context_data.get(username, {
-            'topics_discussed': [],
-            'preferences': {},
-            'interaction_count': 0,
-            'last_interaction': None
-        })
-    
-    def update_user_context(self, username, message):
-        context_data = self.load_data(self.context_file)
-        if username not in context_data:
-            context_data[username] = {
-                'topics_discussed': [],
-                'preferences': {},
-                'interaction_count': 0,
-                'last_interaction': None
-            }
-        
-        # Update context
-        context_data[username]['topics_discussed'].append({
-            'message': message[:100],
-            'timestamp': datetime.now().isoformat()
-        })
-        # Keep only last 50 topics
-        context_data[username]['topics_discussed'] = context_data[username]['topics_discussed'][-50:]
-        context_data[username]['interaction_count'] += 1
-        context_data[username]['last_interaction'] = datetime.now().isoformat()
-        
-        self.save_data(self.context_file, context_data)
+# Initialize database (one instance per process, shared by all sessions)
+@st.cache_resource
+def get_database():
+    database = create_database()
+    # Optional in-process retention job; `python retention.py` does the same from cron
+    interval = os.getenv("RETENTION_INTERVAL_MINUTES")
+    if interval:
+        start_background_retention(
+            database,
+            ColdArchive(os.getenv("ARCHIVE_DIR", "archive")),
+            float(interval) * 60
+        )
+    return database
 
-# Initialize database
-db = UserDatabase()
+db = get_database()
 
 # Available models
 MODELS = {
-    'llama-3.1-8b-instant': {'name': 'Fast (8B)', 'speed': '', 'cost': '$'},
-    'llama-3.3-70b-versatile': {'name': 'Smart (70B)', 'speed': '', 'cost': '$$$'},
-    'llama-3.2-90b-text-preview': {'name': 'Advanced (90B)', 'speed': '', 'cost': '$$$$'}
+    'llama-3.1-8b-instant': {'name': 'Fast (8B)', 'speed': '', 'cost': '$', 'memory_tokens': 2000},
+    'llama-3.3-70b-versatile': {'name': 'Smart (70B)', 'speed': '', 'cost': '$$$', 'memory_tokens': 4000},
+    'llama-3.2-90b-text-preview': {'name': 'Advanced (90B)', 'speed': '', 'cost': '$$$$', 'memory_tokens': 4000}
 }
 
+# MEMORY_MODE=budget keeps recent turns within the model's memory_tokens and
+# summarizes older ones with SUMMARY_MODEL; MEMORY_MODE=buffer keeps everything
+MEMORY_MODE = os.getenv("MEMORY_MODE", "budget").lower()
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "llama-3.1-8b-instant")
+# Completion tokens charged against LLM_TOKENS_PER_MINUTE on top of the prompt
+REPLY_TOKEN_ESTIMATE = int(os.getenv("LLM_REPLY_TOKENS", "512"))
+
+# "Auto" picks a model per turn from the prompt (see model_router.py)
+AUTO_MODEL = "auto"
+
+# Built chains kept per session for reopened chats
+CHAIN_CACHE_SIZE = int(os.getenv("CHAIN_CACHE_SIZE", "8"))
+
+# Uploaded-file excerpts added to each turn's prompt: at most RETRIEVAL_TOP_K
+# chunks and RETRIEVAL_TOKENS tokens; RETRIEVAL_TOP_K=0 turns this off
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+RETRIEVAL_TOKENS = int(os.getenv("RETRIEVAL_TOKENS", "1500"))
+
+# Messages drawn per chat; "Load earlier" shows CHAT_WINDOW more. 0 draws all
+CHAT_WINDOW = int(os.getenv("CHAT_WINDOW", "30"))
+
+# Session token lifetimes and the cookie that carries the token
+SESSION_SECONDS = 12 * 3600
+REMEMBER_ME_SECONDS = 30 * 24 * 3600
+SESSION_COOKIE = "iyyappan_session"
+
+# Recent chats shown per sidebar page
+CONVERSATION_PAGE_SIZE = 20
+
+# Users who see the performance panel: cache hit rates, and spans when TRACING is on (comma separated)
+ADMIN_USERS = {u.strip() for u in os.getenv("ADMIN_USERS", "").split(",") if u.strip()}
+# Prometheus textfile export of the span histograms, rewritten at most every 10s
+METRICS_FILE = os.getenv("METRICS_FILE") or None
+
 # Fixed response for personal identity
 IYYAPPAN_PROFILE_RESPONSE = """
 Iyyappan is an aspiring AI and Software Developer with a strong interest in building intelligent, user-centric applications.
@@ -153,10 +105,107 @@ Currently, Iyyappan is focused on strengthening his expertise in Artificial Inte
 He values clean architecture, practical problem-solving, and continuous professional growth.
 """
 
-# Authentication
-def login_page():
-    st.markdown(
-        """
+# Process-wide fast paths and response cache, shared by all sessions
+@st.cache_resource
+def get_fast_paths():
+    registry = FastPathRegistry()
+    registry.register(
+        ["who is iyyappan", "who's iyyappan", "tell me about iyyappan"],
+        IYYAPPAN_PROFILE_RESPONSE
+    )
+    # FAST_PATH_FILE adds canned intents: {"intents": [{"phrases": [...], "response": "..."}]}
+    if os.getenv("FAST_PATH_FILE"):
+        registry.load_file(os.getenv("FAST_PATH_FILE"))
+    tracing.register_cache("fast_path", registry.stats)
+    return registry
+
+@st.cache_resource
+def get_response_cache():
+    cache = ResponseCache(
+        maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "2048")),
+        ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+    )
+    tracing.register_cache("response", cache.stats)
+    return cache
+
+@st.cache_resource
+def get_semantic_cache():
+    # SEMANTIC_CACHE_SIZE=0 turns paraphrase matching off
+    capacity = int(os.getenv("SEMANTIC_CACHE_SIZE", "10000"))
+    if capacity <= 0:
+        return None
+    from semantic_cache import SemanticCache
+    cache = SemanticCache(
+        capacity=capacity,
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.8"))
+    )
+    tracing.register_cache("semantic", cache.stats)
+    return cache
+
+@st.cache_resource
+def get_router():
+    return ModelRouter(
+        simple_model=os.getenv("ROUTER_SIMPLE_MODEL", "llama-3.1-8b-instant"),
+        hard_model=os.getenv("ROUTER_HARD_MODEL", "llama-3.3-70b-versatile"),
+        models=list(MODELS.keys()),
+        threshold=int(os.getenv("ROUTER_THRESHOLD", "2")),
+        log_path=os.getenv("ROUTER_LOG_FILE") or None
+    )
+
+@st.cache_resource
+def get_scheduler():
+    # 0 turns the requests/min or tokens/min budget off
+    return RequestScheduler(
+        requests_per_minute=int(os.getenv("LLM_REQUESTS_PER_MINUTE", "30")),
+        tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", "0")),
+        per_user_limit=int(os.getenv("LLM_USER_CONCURRENCY", "2")),
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+        backoff_seconds=float(os.getenv("LLM_BACKOFF_SECONDS", "1")),
+        max_backoff_seconds=float(os.getenv("LLM_MAX_BACKOFF_SECONDS", "20")),
+        queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "60"))
+    )
+
+@st.cache_resource
+def get_ingestor():
+    # Uploads are extracted and chunked off the script thread
+    return Ingestor(
+        workers=int(os.getenv("INGEST_WORKERS", "2")),
+        max_bytes=int(float(os.getenv("INGEST_CACHE_MB", "64")) * (1 << 20)),
+        chunk_chars=int(os.getenv("INGEST_CHUNK_CHARS", "1500"))
+    )
+
+@st.cache_resource
+def get_doc_indexes():
+    # One BM25 index of uploaded-file chunks per user, kept on disk
+    from retrieval import IndexRegistry
+    return IndexRegistry(
+        os.getenv("RETRIEVAL_DIR", "retrieval"),
+        dense=os.getenv("RETRIEVAL_DENSE", "0").lower() in ("1", "true", "yes")
+    )
+
+def retrieve_context(user_input):
+    # Top-k excerpts from this user's files, within RETRIEVAL_TOKENS
+    indexes = get_doc_indexes()
+    if RETRIEVAL_TOP_K <= 0 or not indexes.has_documents(st.session_state.username):
+        return ""
+    with span("retrieval.search"):
+        chunks = indexes.get(st.session_state.username).retrieve(
+            user_input, k=RETRIEVAL_TOP_K, max_tokens=RETRIEVAL_TOKENS
+        )
+    from retrieval import format_context
+    return format_context(chunks)
+
+def minify_css(css):
+    # Drop comments and the source indentation; the rules are unchanged
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r":\s+", ":", css)
+    return re.sub(r"\s*([{};,>])\s*", r"\1", css).strip()
+
+# Login page styles. Streamlit removes whatever a rerun does not send again,
+# so the block goes out on every unauthenticated rerun; it is minified once
+# per process and sent as a style-only st.html, which takes no layout space.
+LOGIN_CSS = minify_css("""
         <style>
         /* Hide Streamlit branding */
         #MainMenu {visibility: hidden;}
@@ -453,9 +502,11 @@ def login_page():
             border-bottom: 2px solid #1f2937 !important;
         }
         </style>
-        """,
-        unsafe_allow_html=True
-    )
+""")
+
+# Authentication
+def login_page():
+    st.html(LOGIN_CSS)
 
     # Create centered container
     col1, col2, col3 = st.columns([1, 1.2, 1])
@@ -532,15 +583,24 @@ def login_page():
                 if submit:
                     if not email or not password:
                         st.error(" Please fill in all fields")
-                    elif db.verify_user(email, password):
-                        st.session_state.logged_in = True
-                        st.session_state.username = email
-                        st.success(" Login successful!")
-                        import time
-                        time.sleep(1)
-                        st.rerun()
                     else:
-                        st.error(" Invalid email or password")
+                        try:
+                            verified = db.verify_user(email, password)
+                        except AuthBusy:
+                            verified = None
+                        if verified is None:
+                            st.error(" Too many sign-in attempts right now, please try again")
+                        elif verified:
+                            st.session_state.logged_in = True
+                            st.session_state.username = email
+                            # Signed token in a cookie lets reloads skip the password
+                            # check; without "Remember me" it ends with the browser session
+                            ttl = REMEMBER_ME_SECONDS if remember else SESSION_SECONDS
+                            token = create_session_token(email, ttl, db.session_epoch(email))
+                            st.session_state.session_cookie = (token, ttl if remember else None)
+                            st.rerun()
+                        else:
+                            st.error(" Invalid email or password")
 
             # Footer
             st.markdown(
@@ -568,13 +628,17 @@ def login_page():
                         st.error(" Passwords don't match")
                     elif len(new_password) < 6:
                         st.error(" Password must be at least 6 characters")
-                    elif db.create_user(new_email, new_password):
-                        st.success(" Account created! Please sign in.")
-                        import time
-                        time.sleep(1)
-                        st.rerun()
                     else:
-                        st.error(" User already exists")
+                        try:
+                            created = db.create_user(new_email, new_password)
+                        except AuthBusy:
+                            created = None
+                        if created is None:
+                            st.error(" Too many sign-up attempts right now, please try again")
+                        elif created:
+                            st.success(" Account created! Please sign in.")
+                        else:
+                            st.error(" User already exists")
 
             st.markdown(
                 '<div class="login-footer">Already have an account? <a href="#" class="signup-link">Sign In</a></div>',
@@ -591,6 +655,19 @@ def init_session_state():
     if "username" not in st.session_state:
         st.session_state.username = None
     
+    # Tokens used to travel in the URL; drop them from old links and bookmarks
+    if "session" in st.query_params:
+        del st.query_params["session"]
+    
+    # Restore a signed-in session from its cookie once, when the session starts
+    if "cookie_checked" not in st.session_state:
+        st.session_state.cookie_checked = True
+        token = st.context.cookies.get(SESSION_COOKIE)
+        username = token and verify_session_token(token, db.session_epoch)
+        if username and not st.session_state.logged_in:
+            st.session_state.logged_in = True
+            st.session_state.username = username
+    
     if "current_conv_id" not in st.session_state:
         st.session_state.current_conv_id = None
     
@@ -602,22 +679,68 @@ def init_session_state():
     
     if "selected_model" not in st.session_state:
         st.session_state.selected_model = "llama-3.3-70b-versatile"
+    
+    if "last_prompt_tokens" not in st.session_state:
+        st.session_state.last_prompt_tokens = None
+    
+    if "last_model" not in st.session_state:
+        st.session_state.last_model = None
+    
+    if "stream_responses" not in st.session_state:
+        st.session_state.stream_responses = True
+    
+    if "conv_list_limit" not in st.session_state:
+        st.session_state.conv_list_limit = CONVERSATION_PAGE_SIZE
+    
+    # Upload file_id -> ingestion job, so reruns neither rehash nor resubmit
+    if "uploads" not in st.session_state:
+        st.session_state.uploads = {}
+    
+    # (username, panel) -> storage data behind a sidebar panel, see panel_data()
+    if "panel_data" not in st.session_state:
+        st.session_state.panel_data = {}
+    
+    if "render_cache" not in st.session_state:
+        st.session_state.render_cache = RenderCache(max(4 * CHAT_WINDOW, 256))
+    
+    # Visible message count, reset whenever another chat is shown
+    if "chat_window" not in st.session_state:
+        st.session_state.chat_window = (None, CHAT_WINDOW)
 
-def init_llm(model_name, temperature=0.7):
-    llm = ChatGroq(
-        groq_api_key=os.getenv("GROQ_API_KEY"),
-        model_name=model_name,
-        temperature=temperature
-    )
+@traced("init_llm")
+def init_llm(model_name, temperature=0.7, messages=None):
+    from langchain_classic.chains import ConversationChain
+    from langchain_classic.memory import ConversationBufferMemory
+    from chat_memory import TokenBudgetMemory, load_messages
+    from llm_clients import get_llm
+
+    # Auto chains start on the small model and are re-routed every turn
+    if model_name == AUTO_MODEL:
+        model_name = get_router().simple_model
+    
+    # Shared process-wide client; only the chain and its memory are per session
+    llm = get_llm(model_name, temperature)
     
     # Get user context for memory
     context = db.get_user_context(st.session_state.username)
     
     # Add context to memory initialization
-    memory = ConversationBufferMemory()
+    if MEMORY_MODE == "budget":
+        # Summaries are written while the reply still holds the user's
+        # scheduler slot, so they are admitted under a key of their own
+        user = st.session_state.username
+        memory = TokenBudgetMemory(
+            llm=get_llm(SUMMARY_MODEL, 0.0),
+            max_token_limit=MODELS[model_name]['memory_tokens'],
+            summarize=lambda call, tokens: get_scheduler().run(("summary", user), call, tokens)
+        )
+    else:
+        memory = ConversationBufferMemory()
     
-    # Add context summary to memory
-    if context['topics_discussed']:
+    # A reopened chat carries its own context; new chats get the user summary
+    if messages:
+        load_messages(memory, messages, MODELS[model_name]['memory_tokens'])
+    elif context['topics_discussed']:
         recent_topics = context['topics_discussed'][-5:]
         context_summary = "Previous context: " + "; ".join([t['message'] for t in recent_topics])
         memory.save_context(
@@ -631,24 +754,122 @@ def init_llm(model_name, temperature=0.7):
         verbose=False
     )
 
-def main_app():
-    # Sidebar
-    with st.sidebar:
+def generate_reply(conversation, model, user_input, container, features=None, context=""):
+    # Tries `model` first and moves on to the others on rate limits or timeouts.
+    # A streamed reply that already showed tokens is not retried.
+    from llm_clients import get_llm
+    router = get_router()
+    scheduler = get_scheduler()
+    user = st.session_state.username
+    tokens = (st.session_state.last_prompt_tokens or 0) + REPLY_TOKEN_ESTIMATE
+    temperature = getattr(conversation.llm, 'temperature', 0.7)
+    models = router.fallbacks(model)
+    if st.session_state.stream_responses:
+        with container:
+            with st.chat_message("user"):
+                st.markdown(user_input)
+            assistant = st.chat_message("assistant")
+    for attempt, candidate in enumerate(models):
+        conversation.llm = get_llm(candidate, temperature)
+        reply = None
+        start = time.perf_counter()
+        try:
+            if st.session_state.stream_responses:
+                # Paint tokens as they arrive; memory and persistence see the final text
+                reply = StreamedReply(conversation, user_input, context)
+                with assistant, span("llm.stream"):
+                    st.write_stream(scheduler.stream(user, lambda: iter(reply), tokens))
+                response = reply.text
+            else:
+                with st.spinner("Thinking..."), span("llm.predict"):
+                    response = scheduler.run(user, lambda: complete_reply(conversation, user_input, context), tokens)
+        except Exception as exc:
+            router.record(candidate, time.perf_counter() - start, ok=False, features=features)
+            if not is_fallback_error(exc) or (reply is not None and reply.started) or attempt == len(models) - 1:
+                raise
+            logging.getLogger(__name__).warning(
+                "%s unavailable (%s), falling back to %s", candidate, type(exc).__name__, models[attempt + 1]
+            )
+            continue
+        router.record(candidate, time.perf_counter() - start, features=features)
+        return response, candidate
+
+def open_chain(conv_id, messages):
+    # Reuse this session's chain for the chat if it is still cached; otherwise
+    # rebuild its memory from the stored messages. The cache comes with the
+    # session's first chain, as chat_memory pulls in LangChain.
+    if "chains" not in st.session_state:
+        from chat_memory import ChainCache
+        st.session_state.chains = ChainCache(CHAIN_CACHE_SIZE)
+    key = (conv_id, st.session_state.selected_model)
+    chain = st.session_state.chains.get(key) if conv_id else None
+    if chain is None:
+        chain = init_llm(st.session_state.selected_model, messages=messages)
+        if conv_id:
+            st.session_state.chains.put(key, chain)
+    return chain
+
+# The signed-in page is four fragments: a widget inside one reruns only that
+# fragment. The storage reads behind the sidebar panels are kept per session
+# until invalidate() drops them, so full reruns redraw those panels from
+# memory; an action that changes what another fragment shows reruns that
+# fragment by key.
+def panel_data(name, load):
+    key = (st.session_state.username, name)
+    if key not in st.session_state.panel_data:
+        st.session_state.panel_data[key] = load()
+    return st.session_state.panel_data[key]
+
+def invalidate(*names):
+    for name in names:
+        st.session_state.panel_data.pop((st.session_state.username, name), None)
+
+def rerun_fragment():
+    # Fragment-scoped reruns are only allowed while the fragment reruns on
+    # its own; during a full run the whole app reruns
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+def open_conversation(conv_id):
+    # on_click callback: only the chat pane changes
+    opened = db.get_conversation(st.session_state.username, conv_id)
+    st.session_state.current_conv_id = conv_id
+    st.session_state.chat_history = list(opened['messages']) if opened else []
+    st.session_state.conversation = None
+    st.rerun("chat_pane")
+
+def start_new_chat():
+    st.session_state.current_conv_id = datetime.now().isoformat()
+    st.session_state.chat_history = []
+    st.session_state.conversation = None
+    st.rerun("chat_pane")
+
+def delete_conversation(conv_id):
+    db.delete_conversation(st.session_state.username, conv_id)
+    if "chains" in st.session_state:
+        st.session_state.chains.discard(conv_id)
+    invalidate("conversations")
+    st.rerun("recent_chats")
+
+@st.fragment(key="controls")
+def session_controls():
+    with span("render.controls"):
         st.markdown(f"###  {st.session_state.username}")
         
         if st.button(" Logout"):
+            # Revokes this user's session tokens everywhere and clears the cookie
+            db.revoke_sessions(st.session_state.username)
             st.session_state.logged_in = False
             st.session_state.username = None
+            st.session_state.session_cookie = ("", 0)
             st.rerun()
         
         st.markdown("---")
         
         # New Chat Button
-        if st.button(" New Chat", use_container_width=True):
-            st.session_state.current_conv_id = datetime.now().isoformat()
-            st.session_state.chat_history = []
-            st.session_state.conversation = init_llm(st.session_state.selected_model)
-            st.rerun()
+        st.button(" New Chat", use_container_width=True, on_click=start_new_chat)
         
         st.markdown("---")
         
@@ -656,25 +877,45 @@ def main_app():
         st.markdown("####  Model Selection")
         selected_model = st.selectbox(
             "Choose Model",
-            options=list(MODELS.keys()),
-            format_func=lambda x: f"{MODELS[x]['name']} {MODELS[x]['speed']} {MODELS[x]['cost']}",
+            options=[AUTO_MODEL] + list(MODELS.keys()),
+            format_func=lambda x: "Auto (by prompt)" if x == AUTO_MODEL else f"{MODELS[x]['name']} {MODELS[x]['speed']} {MODELS[x]['cost']}",
             key="model_selector"
         )
         
         if selected_model != st.session_state.selected_model:
             st.session_state.selected_model = selected_model
-            st.session_state.conversation = init_llm(selected_model)
+            st.session_state.conversation = None
         
         # Temperature
         temperature = st.slider("Temperature", 0.0, 1.0, 0.7, 0.1)
         
-        st.markdown("---")
-        
+        st.toggle("Stream responses", key="stream_responses")
+
+@st.fragment(key="context")
+def context_panel():
+    with span("render.context"):
         # User Context Display
         st.markdown("####  Context Memory")
-        context = db.get_user_context(st.session_state.username)
+        context = panel_data("context", lambda: db.get_user_context(st.session_state.username))
         
         st.metric("Total Interactions", context['interaction_count'])
+        if st.session_state.last_prompt_tokens:
+            st.caption(f"Prompt size last turn: ~{st.session_state.last_prompt_tokens} tokens")
+        if st.session_state.last_model:
+            st.caption(f"Answered by: {MODELS.get(st.session_state.last_model, {'name': st.session_state.last_model})['name']}")
+        
+        router_stats = get_router().stats()
+        if router_stats:
+            with st.expander("Model latency"):
+                queue = get_scheduler().stats()
+                st.caption(
+                    f"Queue: {queue['queued']} waiting (peak {queue['peak_queued']}), "
+                    f"{queue['in_flight']} in flight, {queue['retries']} retries"
+                )
+                for model, stats in router_stats.items():
+                    p50 = f"{stats['p50']:.2f}s" if stats['p50'] is not None else "-"
+                    p95 = f"{stats['p95']:.2f}s" if stats['p95'] is not None else "-"
+                    st.caption(f"{MODELS.get(model, {'name': model})['name']}: p50 {p50}, p95 {p95}, {stats['calls']} calls, {stats['errors']} errors")
         
         if context['last_interaction']:
             last_time = datetime.fromisoformat(context['last_interaction'])
@@ -689,32 +930,51 @@ def main_app():
             st.markdown("*Recent Topics:*")
             for topic in context['topics_discussed'][-3:]:
                 st.caption(f"• {topic['message'][:50]}...")
-        
-        st.markdown("---")
-        
-        # Conversation History (Last 7 days)
-        st.markdown("####  Recent Chats (7 days)")
-        conversations = db.get_user_conversations(st.session_state.username)
+
+@st.fragment(key="recent_chats")
+def recent_chats():
+    with span("render.chats"):
+        # Conversation History (retention window)
+        st.markdown(f"####  Recent Chats ({db.retention_days} days)")
+        if db.search_index is not None:
+            query = st.text_input("Search chats", key="chat_search", placeholder="Search your chats")
+            if query.strip():
+                results = db.search_conversations(st.session_state.username, query, limit=10)
+                for result in results:
+                    st.button(f" {result['title'][:20]}...", key=f"found_{result['id']}",
+                              use_container_width=True, on_click=open_conversation, args=(result['id'],))
+                    st.caption(result['snippet'])
+                if not results:
+                    st.caption("No matching chats")
+        # Only metadata is listed; messages are fetched when a chat is opened
+        limit = st.session_state.conv_list_limit
+        conversations = panel_data(
+            "conversations", lambda: db.list_conversations(st.session_state.username, limit=limit + 1)
+        )
         
         if conversations:
-            for conv in conversations:
+            for conv in conversations[:limit]:
                 col1, col2 = st.columns([3, 1])
                 with col1:
-                    if st.button(
+                    st.button(
                         f" {conv['title'][:20]}...",
                         key=f"load_{conv['id']}",
-                        use_container_width=True
-                    ):
-                        st.session_state.current_conv_id = conv['id']
-                        st.session_state.chat_history = conv['messages']
-                        st.rerun()
+                        use_container_width=True,
+                        on_click=open_conversation,
+                        args=(conv['id'],)
+                    )
                 with col2:
-                    if st.button("", key=f"del_{conv['id']}"):
-                        db.delete_conversation(st.session_state.username, conv['id'])
-                        st.rerun()
+                    st.button("", key=f"del_{conv['id']}", on_click=delete_conversation, args=(conv['id'],))
+            if len(conversations) > limit:
+                if st.button("Show more", use_container_width=True):
+                    st.session_state.conv_list_limit += CONVERSATION_PAGE_SIZE
+                    invalidate("conversations")
+                    rerun_fragment()
         else:
             st.info("No recent chats")
-    
+
+@st.fragment(key="chat_pane")
+def chat_pane():
     # Main chat area
     col_title, col_clear = st.columns([6, 1])
     with col_title:
@@ -723,26 +983,30 @@ def main_app():
         if st.button(" Clear Chat", use_container_width=True):
             st.session_state.chat_history = []
             st.session_state.current_conv_id = None
-            st.session_state.conversation = init_llm(st.session_state.selected_model)
-            st.rerun()
-    
-    # Initialize conversation if not exists
-    if st.session_state.conversation is None:
-        st.session_state.conversation = init_llm(st.session_state.selected_model)
+            st.session_state.conversation = None
+            rerun_fragment()
     
     # Display chat history
     chat_container = st.container()
-    with chat_container:
-        for role, msg in st.session_state.chat_history:
-            if role == "user":
-                with st.chat_message("user"):
-                    st.markdown(msg)
-            else:
-                with st.chat_message("assistant"):
-                    st.markdown(msg)
+    with chat_container, span("render.chat"):
+        history = st.session_state.chat_history
+        window_conv, window = st.session_state.chat_window
+        if window_conv != st.session_state.current_conv_id:
+            window = CHAT_WINDOW
+            st.session_state.chat_window = (st.session_state.current_conv_id, window)
+        start = window_start(len(history), window)
+        if start:
+            if st.button(f"Load earlier messages ({start} more)", key="load_earlier"):
+                st.session_state.chat_window = (st.session_state.current_conv_id, window + CHAT_WINDOW)
+                rerun_fragment()
+        render_cache = st.session_state.render_cache
+        for role, msg in history[start:]:
+            with st.chat_message("user" if role == "user" else "assistant"):
+                st.markdown(render_cache.get(role, msg))
     
-    # Chat input
-    user_input = st.chat_input("Type your message here...")
+    # Chat input, still pinned to the bottom of the page from inside the fragment
+    with st.bottom:
+        user_input = st.chat_input("Type your message here...")
     
     # File upload
     uploaded_file = st.file_uploader(
@@ -751,21 +1015,82 @@ def main_app():
     )
     
     if user_input:
+        from chat_memory import estimate_tokens, prompt_tokens
+        from llm_clients import LLM_ERRORS, get_llm
+
+        # The chain is built on the first message after sign-in or a chat
+        # switch, before this message joins the stored history and context
+        if st.session_state.conversation is None:
+            st.session_state.conversation = open_chain(
+                st.session_state.current_conv_id, st.session_state.chat_history
+            )
+        conversation = st.session_state.conversation
         st.session_state.chat_history.append(("user", user_input))
         db.update_user_context(st.session_state.username, user_input)
 
-        # Normalize input
-        normalized_input = user_input.strip().lower()
+        # Canned intents first, then previously generated answers
+        response = get_fast_paths().match(user_input)
+        cache_key = None
+        model = st.session_state.selected_model
+        features = None
+        context = ""
+        if response is None:
+            if model == AUTO_MODEL:
+                model, features = get_router().route(user_input, len(st.session_state.chat_history))
+                conversation.llm = get_llm(model, getattr(conversation.llm, 'temperature', 0.7))
+            context = retrieve_context(user_input)
+        # Answers grounded in the user's files are neither served from nor
+        # added to the shared caches
+        if response is None and not context:
+            cache_key = conversation_cache_key(conversation, user_input)
+            # Paraphrases match within the same model, temperature and context
+            partition = cache_key[:2] + cache_key[3:]
+            response = get_response_cache().get(cache_key)
+            if response is None and get_semantic_cache() is not None:
+                response = get_semantic_cache().lookup(partition, user_input)
+            if response is not None:
+                cache_key = None
+                conversation.memory.save_context(
+                    {conversation.input_key: user_input},
+                    {conversation.output_key: response}
+                )
 
-        # Custom fixed response
-        if normalized_input == "who is iyyappan":
-            response = IYYAPPAN_PROFILE_RESPONSE
-            st.session_state.chat_history.append(("assistant", response))
-        else:
-            with st.spinner("Thinking..."):
-                response = st.session_state.conversation.predict(input=user_input)
-                st.session_state.chat_history.append(("assistant", response))
+        if response is None:
+            st.session_state.last_prompt_tokens = prompt_tokens(conversation, user_input) + (
+                estimate_tokens(context) if context else 0
+            )
+            logging.getLogger(__name__).info(
+                "prompt tokens=%d history messages=%d",
+                st.session_state.last_prompt_tokens, len(st.session_state.chat_history)
+            )
+
+        if response is None:
+            try:
+                response, answered_by = generate_reply(
+                    conversation, model, user_input, chat_container, features, context
+                )
+            except SchedulerBusy:
+                st.session_state.chat_history.pop()
+                st.error("You already have replies in progress, please try again in a moment")
+                st.stop()
+            except LLM_ERRORS as exc:
+                # Rate limits left after retries, server or auth errors
+                logging.getLogger(__name__).warning("reply failed: %r", exc)
+                st.session_state.chat_history.pop()
+                st.error("The model could not answer right now, please try again in a moment")
+                st.stop()
+            st.session_state.last_model = answered_by
+            # Keep the chain on its own model after a fallback
+            if answered_by != model:
+                conversation.llm = get_llm(model, getattr(conversation.llm, 'temperature', 0.7))
+                cache_key = None
+        st.session_state.chat_history.append(("assistant", response))
 
+        # Only freshly generated answers are cached
+        if cache_key is not None:
+            get_response_cache().put(cache_key, response)
+            if get_semantic_cache() is not None:
+                get_semantic_cache().add(partition, user_input, response)
         
         if st.session_state.current_conv_id is None:
             st.session_state.current_conv_id = datetime.now().isoformat()
@@ -778,16 +1103,95 @@ def main_app():
             st.session_state.chat_history,
             title
         )
+        st.session_state.chains.put(
+            (st.session_state.current_conv_id, st.session_state.selected_model), conversation
+        )
         
-        st.rerun()
+        # The sidebar keeps what it shows until its next run, which reloads
+        # the dropped data; only a new chat has to appear in Recent Chats now
+        invalidate("context", "conversations")
+        if len(st.session_state.chat_history) == 2:
+            st.rerun()
+        rerun_fragment()
     
     if uploaded_file:
-        st.success(f"File uploaded: {uploaded_file.name}")
+        job = st.session_state.uploads.get(uploaded_file.file_id)
+        if job is None:
+            job = get_ingestor().submit(uploaded_file.name, uploaded_file)
+            st.session_state.uploads[uploaded_file.file_id] = job
+            # Index the chunks for this user once extraction finishes; a
+            # document already in their index is skipped. The job may be
+            # shared with another user's upload of the same bytes, so the
+            # name comes from this upload
+            index = get_doc_indexes().get(st.session_state.username)
+            name = uploaded_file.name
+            job.add_done_callback(
+                lambda job: job.error or index.add_document(job.digest, name, job.chunks)
+            )
+        if job.status == "processing":
+            st.info(f"Processing {uploaded_file.name}: {job.pages} pages, {job.chunk_count} chunks so far")
+        elif job.status == "failed":
+            st.error(f"Could not read {uploaded_file.name}: {job.error}")
+        else:
+            st.success(f"File processed: {uploaded_file.name} ({job.pages} pages, {job.chunk_count} chunks)")
+
+def write_session_cookie(token, max_age):
+    # Streamlit cannot set cookies, so a script in an empty same-origin
+    # iframe sets it on the app page; max_age None makes a browser-session cookie
+    cookie = f"{SESSION_COOKIE}={token}; Path=/; SameSite=Strict"
+    if max_age is not None:
+        cookie += f"; Max-Age={max_age}"
+    st.iframe(
+        f"<script>const page = window.parent; page.document.cookie = {json.dumps(cookie)} + "
+        f"(page.location.protocol === 'https:' ? '; Secure' : '');</script>",
+        height="content"
+    )
+
+def main_app():
+    with st.sidebar:
+        session_controls()
+        st.markdown("---")
+        context_panel()
+        st.markdown("---")
+        recent_chats()
+    chat_pane()
+
+def performance_panel():
+    stats = tracing.stats()
+    caches = tracing.cache_stats()
+    if not stats and not caches:
+        return
+    with st.expander("Performance"):
+        if stats:
+            st.dataframe(
+                [{'span': name, 'count': s['count'], 'mean ms': round(s['mean'] * 1e3, 2),
+                  'p50 ms': round(s['p50'] * 1e3, 2), 'p95 ms': round(s['p95'] * 1e3, 2)}
+                 for name, s in stats.items()],
+                hide_index=True
+            )
+        if caches:
+            st.dataframe(
+                [{'cache': name, 'hits': c['hits'], 'misses': c['misses'],
+                  'hit rate': f"{c['hit_rate']:.0%}", 'entries': c['entries']}
+                 for name, c in caches.items()],
+                hide_index=True
+            )
+        st.download_button("Prometheus metrics", tracing.prometheus_text(), file_name="metrics.prom")
 
 # Main execution
-init_session_state()
+try:
+    with span("rerun"):
+        init_session_state()
+        if "session_cookie" in st.session_state:
+            write_session_cookie(*st.session_state.pop("session_cookie"))
 
-if not st.session_state.logged_in:
-    login_page()
-else:
-    main_app()
\ No newline at end of file
+        if not st.session_state.logged_in:
+            login_page()
+        else:
+            main_app()
+            if st.session_state.username in ADMIN_USERS:
+                with st.sidebar:
+                    performance_panel()
+finally:
+    if METRICS_FILE:
+        tracing.write_prometheus(METRICS_FILE, min_interval=10)
\ No newline at end of file
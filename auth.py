@@ -0,0 +1,129 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+# Password hashing. New hashes use the KDF configured here; stored hashes
+# carry their own parameters, and older formats (including the original
+# unsalted SHA-256 hex digests) still verify and are flagged for rehash.
+PASSWORD_KDF = os.getenv("PASSWORD_KDF", "pbkdf2").lower()
+PBKDF2_ITERATIONS = int(os.getenv("PBKDF2_ITERATIONS", "600000"))
+SCRYPT_N = int(os.getenv("SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+# KDF work runs on a small shared pool; hashlib releases the GIL while it
+# hashes, and the semaphore caps how many requests can queue behind it
+AUTH_WORKERS = int(os.getenv("AUTH_WORKERS", "4"))
+_pool = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="auth")
+_slots = threading.BoundedSemaphore(AUTH_WORKERS * 8)
+
+
+class AuthBusy(Exception):
+    pass
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _derive(password, salt, kdf, params):
+    if kdf == "scrypt":
+        n, r, p = params
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=128 * n * r * 2, dklen=32)
+    (iterations,) = params
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+
+
+def _current_params():
+    if PASSWORD_KDF == "scrypt":
+        return "scrypt", (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return "pbkdf2_sha256", (PBKDF2_ITERATIONS,)
+
+
+def hash_password(password):
+    kdf, params = _current_params()
+    salt = secrets.token_bytes(16)
+    digest = _derive(password, salt, kdf, params)
+    return "$".join([kdf, *map(str, params), _b64(salt), _b64(digest)])
+
+
+def verify_password(stored, password):
+    # Returns (matches, needs_rehash)
+    parts = stored.split("$")
+    if len(parts) == 1:
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(stored, legacy), True
+
+    kdf, *params, salt, digest = parts
+    params = tuple(int(p) for p in params)
+    derived = _derive(password, _unb64(salt), kdf, params)
+    matches = hmac.compare_digest(derived, _unb64(digest))
+    return matches, (kdf, params) != _current_params()
+
+
+_dummy_hash = None
+
+
+def dummy_hash():
+    # Stand-in hash checked for unknown usernames, so a failed sign-in costs
+    # the same KDF work whether or not the account exists
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(secrets.token_hex(16))
+    return _dummy_hash
+
+
+def run_in_pool(fn, *args, timeout=30):
+    if not _slots.acquire(timeout=timeout):
+        raise AuthBusy("too many sign-in requests in flight")
+    try:
+        return _pool.submit(fn, *args).result(timeout=timeout)
+    except FutureTimeout:
+        raise AuthBusy("sign-in request timed out")
+    finally:
+        _slots.release()
+
+
+# Signed session tokens: "<username b64>.<epoch>.<expiry>.<hmac>". The epoch
+# is the user's session counter at sign-in; bumping it on logout revokes every
+# token issued before. Without a configured SESSION_SECRET the key is per
+# process, so tokens stop working after a restart.
+SESSION_SECRET = (os.getenv("SESSION_SECRET") or secrets.token_hex(32)).encode()
+
+
+def _sign(payload):
+    return _b64(hmac.new(SESSION_SECRET, payload.encode(), hashlib.sha256).digest())
+
+
+def create_session_token(username, ttl_seconds, epoch=0):
+    payload = f"{_b64(username.encode())}.{epoch}.{int(time.time() + ttl_seconds)}"
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify_session_token(token, current_epoch):
+    # Returns the username for a valid, unexpired and unrevoked token,
+    # otherwise None; current_epoch(username) reads the user's counter
+    try:
+        user_part, epoch, expiry, signature = token.split(".")
+        payload = f"{user_part}.{epoch}.{expiry}"
+        # Bytes, as compare_digest rejects str with non-ASCII characters
+        if not hmac.compare_digest(signature.encode(), _sign(payload).encode()):
+            return None
+        if int(expiry) < time.time():
+            return None
+        username = _unb64(user_part).decode()
+    except (ValueError, UnicodeError):
+        return None
+    if int(epoch) != current_epoch(username):
+        return None
+    return username
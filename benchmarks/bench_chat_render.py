@@ -0,0 +1,82 @@
+# Rerun time of the signed-in page as chat history grows.
+#
+#   python benchmarks/bench_chat_render.py --messages 20 200 2000 --windows 0 30
+#
+# Drives app.py through Streamlit's AppTest with the offline fake model: a
+# signed-in session gets a synthetic history of --messages messages, then
+# the page is rerun --reruns times with no input, which is what every click
+# elsewhere on the page costs. --windows sets CHAT_WINDOW; 0 draws the whole
+# history as before windowing.
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+WORDS = ("python streamlit model token memory answer question context chat groq "
+         "llama response prompt data file user system value list function error").split()
+
+
+def make_history(count, rng):
+    history = []
+    for i in range(count):
+        if i % 2 == 0:
+            history.append(("user", " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 25)))))
+        else:
+            paragraphs = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(30, 80))) for _ in range(3)]
+            history.append(("assistant", "\n\n".join(paragraphs) + "\n\n```python\nprint('costs $5')\n```"))
+    return history
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))] * 1e3
+
+
+def measure(count, window, args):
+    from streamlit.testing.v1 import AppTest
+
+    os.environ["CHAT_WINDOW"] = str(window)
+    at = AppTest.from_file(os.path.join(REPO, "app.py"), default_timeout=args.timeout).run()
+    at.session_state.logged_in = True
+    at.session_state.username = "render@example.com"
+    at.run()
+    at.session_state.chat_history = make_history(count, random.Random(count))
+    at.session_state.current_conv_id = "render-bench"
+    at.run()
+    samples = []
+    for _ in range(args.reruns):
+        start = time.perf_counter()
+        at.run()
+        samples.append(time.perf_counter() - start)
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return samples, len(at.chat_message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, nargs="+", default=[20, 200, 2000])
+    parser.add_argument("--windows", type=int, nargs="+", default=[0, 30])
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    # AppTest's session_state setter warns about the missing script context
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
+    os.environ.update({"LLM_BACKEND": "fake", "GROQ_API_KEY": os.getenv("GROQ_API_KEY", "bench")})
+    os.chdir(tempfile.mkdtemp(prefix="bench-render-"))
+    print(f"{'messages':>9}{'window':>8}{'drawn':>7}{'rerun p50 ms':>14}{'p95 ms':>9}")
+    for count in args.messages:
+        for window in args.windows:
+            samples, drawn = measure(count, window, args)
+            print(f"{count:>9}{window:>8}{drawn:>7}{percentile(samples, 0.5):>14.1f}{percentile(samples, 0.95):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
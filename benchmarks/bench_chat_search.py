@@ -0,0 +1,83 @@
+# Chat history search latency for one user.
+#
+#   python benchmarks/bench_chat_search.py --convs 100 500 --messages 20
+#
+# Each run saves --convs synthetic conversations through the search index the
+# way save_conversation does (one call per turn, so only the new tail is
+# indexed), deletes a tenth of them, then times searches in the live index
+# and a cold reload of the index file.
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from chat_search import ChatSearchIndex  # noqa: E402
+
+WORDS = ("python streamlit model token memory answer question context chat groq "
+         "llama response prompt data file user system value list function error "
+         "docker kubernetes postgres index cache latency thread process queue").split()
+USER = "bench@example.com"
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))] * 1e3
+
+
+def run(convs, args, base):
+    rng = random.Random(convs)
+    directory = os.path.join(base, str(convs))
+    index = ChatSearchIndex(directory)
+    saves = []
+    for c in range(convs):
+        messages = []
+        for m in range(args.messages):
+            messages.append(["user" if m % 2 == 0 else "assistant",
+                             " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 80)))])
+            if m % 2:
+                start = time.perf_counter()
+                index.update(USER, f"conv-{c}", messages, f"chat {c}")
+                saves.append(time.perf_counter() - start)
+    for c in rng.sample(range(convs), convs // 10):
+        index.delete(USER, [f"conv-{c}"])
+
+    queries = [" ".join(rng.sample(WORDS, rng.randint(1, 3))) for _ in range(args.queries)]
+    searches = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(USER, query)
+        searches.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    ChatSearchIndex(directory).search(USER, queries[0])
+    cold = time.perf_counter() - start
+    size = os.path.getsize(index.path(USER))
+    shutil.rmtree(directory)
+    return saves, searches, cold, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--convs", type=int, nargs="+", default=[100, 500])
+    parser.add_argument("--messages", type=int, default=20, help="messages per conversation")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    base = tempfile.mkdtemp(prefix="bench-search-")
+    print(f"{'convs':>7}{'messages':>10}{'save p50':>10}{'p95':>8}{'search p50':>12}{'p95':>8}"
+          f"{'cold ms':>9}{'file MB':>9}")
+    for convs in args.convs:
+        saves, searches, cold, size = run(convs, args, base)
+        print(f"{convs:>7}{convs * args.messages:>10}{percentile(saves, 0.5):>10.2f}{percentile(saves, 0.95):>8.2f}"
+              f"{percentile(searches, 0.5):>12.2f}{percentile(searches, 0.95):>8.2f}"
+              f"{cold * 1e3:>9.1f}{size / 2 ** 20:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# Connection reuse of the shared LLM clients against a local Groq stand-in.
+#
+#   python benchmarks/bench_client_pool.py --sessions 20 --turns 5
+#
+# Starts an OpenAI-compatible HTTP server on localhost that counts TCP
+# connections, then runs the same chat turns twice: once building a fresh
+# ChatGroq per chat (the old init_llm behaviour) and once through the
+# shared registry in llm_clients.
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_classic.chains import ConversationChain  # noqa: E402
+from langchain_classic.memory import ConversationBufferMemory  # noqa: E402
+from langchain_groq import ChatGroq  # noqa: E402
+
+import llm_clients  # noqa: E402
+
+
+class StandIn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    requests = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with StandIn.lock:
+            StandIn.connections += 1
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with StandIn.lock:
+            StandIn.requests += 1
+        reply = {
+            "id": "chatcmpl-local",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "local stand-in reply"},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13}
+        }
+        payload = json.dumps(reply).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def reset_counters():
+    StandIn.connections = 0
+    StandIn.requests = 0
+
+
+def run_sessions(make_llm, sessions, turns):
+    start = time.perf_counter()
+    for _ in range(sessions):
+        chain = ConversationChain(llm=make_llm(), memory=ConversationBufferMemory())
+        for turn in range(turns):
+            chain.predict(input=f"question {turn}")
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=5)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["GROQ_API_BASE"] = base_url
+    os.environ.setdefault("GROQ_API_KEY", "local")
+    model = "llama-3.1-8b-instant"
+
+    reset_counters()
+    per_chat = run_sessions(
+        lambda: ChatGroq(groq_api_key="local", model_name=model, temperature=0.7, base_url=base_url),
+        args.sessions, args.turns
+    )
+    per_chat_connections = StandIn.connections
+
+    reset_counters()
+    llm_clients.reset_clients()
+    shared = run_sessions(lambda: llm_clients.get_llm(model, 0.7), args.sessions, args.turns)
+    shared_connections = StandIn.connections
+    server.shutdown()
+
+    total = args.sessions * args.turns
+    print(f"{total} chat turns over {args.sessions} sessions")
+    print(f"per-chat ChatGroq: {per_chat_connections:4d} connections, {per_chat * 1e3:8.1f} ms")
+    print(f"shared registry:   {shared_connections:4d} connections, {shared * 1e3:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# Cold start cost of the login page and the first signed-in render.
+#
+#   python benchmarks/bench_cold_start.py --runs 5
+#   python benchmarks/bench_cold_start.py --compare HEAD~1
+#
+# Every run is a fresh interpreter (streamlit itself is imported before the
+# clock starts) that drives app.py through Streamlit's AppTest with the
+# offline fake model: the login page, the first render after sign-in and the
+# first reply. Also times importing the modules app.py imports at module
+# level, and reports which LLM-stack modules the login page left loaded and
+# the size of the elements it sends. --compare runs the same measurements on
+# the app.py of a git revision, e.g. the one before a change.
+import argparse
+import ast
+import json
+import logging
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LLM_STACK = ("langchain_classic", "langchain_groq", "groq", "httpx", "chat_memory", "llm_clients", "retrieval")
+
+
+def top_level_imports(path):
+    # Modules app.py imports at module level, in order; function bodies are skipped
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+    return [m for m in dict.fromkeys(modules) if m != "streamlit" and not m.startswith("streamlit.")]
+
+
+def payload_bytes(node):
+    # Serialized size of the elements a run sent, containers included
+    size = node.proto.ByteSize() if getattr(node, "proto", None) is not None else 0
+    children = getattr(node, "children", {})
+    return size + sum(payload_bytes(child) for child in children.values())
+
+
+def child(tree, stage):
+    # One cold measurement; prints a JSON row for the parent
+    import streamlit  # noqa: F401
+    from streamlit.testing.v1 import AppTest
+
+    sys.path.insert(0, tree)
+    row = {}
+    if stage == "imports":
+        start = time.perf_counter()
+        for module in top_level_imports(os.path.join(tree, "app.py")):
+            __import__(module)
+        row["import_ms"] = (time.perf_counter() - start) * 1e3
+        print(json.dumps(row))
+        return
+
+    at = AppTest.from_file(os.path.join(tree, "app.py"), default_timeout=120)
+    start = time.perf_counter()
+    at.run()
+    row["login_ms"] = (time.perf_counter() - start) * 1e3
+    row["login_kb"] = payload_bytes(at._tree) / 1024
+    row["login_llm_modules"] = [m for m in LLM_STACK if m in sys.modules]
+
+    at.session_state.logged_in = True
+    at.session_state.username = "coldstart@example.com"
+    start = time.perf_counter()
+    at.run()
+    row["signed_in_ms"] = (time.perf_counter() - start) * 1e3
+
+    at.chat_input[0].set_value("hello there")
+    start = time.perf_counter()
+    at.run()
+    row["first_reply_ms"] = (time.perf_counter() - start) * 1e3
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    print(json.dumps(row))
+
+
+def run_child(tree, stage):
+    cwd = tempfile.mkdtemp(prefix="bench-cold-")
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", tree, "--stage", stage],
+                         cwd=cwd, capture_output=True, text=True)
+    shutil.rmtree(cwd)
+    if out.returncode:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1])
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def measure(tree, runs):
+    # Imports and the app run in separate interpreters so neither warms the other
+    rows = []
+    for _ in range(runs):
+        row = run_child(tree, "app")
+        row.update(run_child(tree, "imports"))
+        rows.append(row)
+    return rows
+
+
+def export(rev):
+    tree = tempfile.mkdtemp(prefix="bench-cold-rev-")
+    archive = subprocess.run(["git", "-C", REPO, "archive", rev], capture_output=True, check=True).stdout
+    subprocess.run(["tar", "-x", "-C", tree], input=archive, check=True)
+    return tree
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per tree")
+    parser.add_argument("--compare", metavar="REV", help="also measure app.py at this git revision")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--stage", choices=("imports", "app"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # AppTest's session_state setter warns about the missing script context
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
+    os.environ.update({"LLM_BACKEND": "fake", "GROQ_API_KEY": os.getenv("GROQ_API_KEY", "bench")})
+    if args.child:
+        child(args.child, args.stage)
+        return
+
+    trees = [(args.compare, export(args.compare))] if args.compare else []
+    trees.append(("working tree", REPO))
+    print(f"{'tree':>14}{'import ms':>11}{'login ms':>10}{'login KB':>10}{'signed-in ms':>14}"
+          f"{'first reply ms':>16}  LLM modules at login")
+    for name, tree in trees:
+        rows = measure(tree, args.runs)
+        median = {key: statistics.median(row[key] for row in rows)
+                  for key in ("import_ms", "login_ms", "login_kb", "signed_in_ms", "first_reply_ms")}
+        print(f"{name[:14]:>14}{median['import_ms']:>11.0f}{median['login_ms']:>10.0f}{median['login_kb']:>10.1f}"
+              f"{median['signed_in_ms']:>14.0f}{median['first_reply_ms']:>16.0f}  "
+              f"{', '.join(rows[0]['login_llm_modules']) or '-'}")
+        if tree != REPO:
+            shutil.rmtree(tree)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# Size and speed of the compact conversation format against pretty-printed JSON.
+#
+#   python benchmarks/bench_compact_format.py --messages 100000
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import compact_format  # noqa: E402
+from file_store import atomic_write_json  # noqa: E402
+
+WORDS = ("python streamlit model token memory answer question context chat groq "
+         "llama response prompt data file user system value list function error").split()
+
+
+def synthetic_corpus(total_messages, users, per_conversation, seed=0):
+    rng = random.Random(seed)
+    data = {}
+    n = 0
+    while n < total_messages:
+        username = f"user{rng.randrange(users)}@example.com"
+        count = min(per_conversation, total_messages - n)
+        messages = []
+        for i in range(count):
+            role = "user" if i % 2 == 0 else "assistant"
+            length = rng.randint(5, 25) if role == "user" else rng.randint(40, 200)
+            messages.append([role, " ".join(rng.choice(WORDS) for _ in range(length))])
+        stamp = f"2026-10-{rng.randint(1, 28):02d}T12:00:00.000000"
+        data.setdefault(username, []).append({
+            'id': f"{stamp}-{n}",
+            'title': messages[0][1][:30],
+            'messages': messages,
+            'created_at': stamp,
+            'updated_at': stamp
+        })
+        n += count
+    return data
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--per-conversation", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    data = synthetic_corpus(args.messages, args.users, args.per_conversation)
+    workdir = tempfile.mkdtemp(prefix="bench-compact-")
+    json_path = os.path.join(workdir, "conversations_data.json")
+    compact_path = os.path.join(workdir, "conversations_data" + compact_format.COMPACT_SUFFIX)
+
+    def load_json():
+        with open(json_path, 'r') as f:
+            return json.load(f)
+
+    username = next(iter(data))
+    conv_id = data[username][-1]['id']
+
+    def read_one_json():
+        return next(c for c in load_json()[username] if c['id'] == conv_id)
+
+    results = {
+        'json': {
+            'save_s': timed(lambda: atomic_write_json(json_path, data), args.repeat),
+            'load_s': timed(load_json, args.repeat),
+            'read_one_s': timed(read_one_json, args.repeat),
+            'bytes': os.path.getsize(json_path),
+        },
+        'compact': {
+            'save_s': timed(lambda: compact_format.dump(data, compact_path), args.repeat),
+            'load_s': timed(lambda: compact_format.load(compact_path), args.repeat),
+            'read_one_s': timed(
+                lambda: compact_format.read_conversation(compact_path, username, conv_id), args.repeat),
+            'bytes': os.path.getsize(compact_path),
+        },
+    }
+    assert compact_format.load(compact_path) == data
+
+    conversations = sum(len(convs) for convs in data.values())
+    print(f"{args.messages} messages, {conversations} conversations, {len(data)} users")
+    print(f"{'format':<10}{'size MB':>10}{'save ms':>10}{'load ms':>10}{'read one ms':>14}")
+    for name, r in results.items():
+        print(f"{name:<10}{r['bytes'] / 1e6:>10.2f}{r['save_s'] * 1e3:>10.1f}"
+              f"{r['load_s'] * 1e3:>10.1f}{r['read_one_s'] * 1e3:>14.2f}")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
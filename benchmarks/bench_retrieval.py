@@ -0,0 +1,131 @@
+# Retrieval latency for one user's document index at 10k-1M chunks.
+#
+#   python benchmarks/bench_retrieval.py --chunks 10000 100000
+#   python benchmarks/bench_retrieval.py --chunks 1000000 --queries 50 --no-dense
+#
+# For each size a synthetic corpus (Zipf-distributed vocabulary, ~200 words
+# per chunk, about what INGEST_CHUNK_CHARS=1500 yields) is added in
+# documents of --doc-chunks chunks, then the index is reopened from disk and
+# queried. Corpus generation is not timed. Reports build rate, size on disk,
+# reload time and p50/p95 of search() and retrieve() for BM25 and, unless
+# --no-dense, BM25 + dense.
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from retrieval import DocumentIndex  # noqa: E402
+
+
+def vocabulary(size, rng):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(3, 10))))
+    return sorted(words)
+
+
+def make_chunks(count, words, probabilities, words_per_chunk, rng):
+    picks = rng.choice(len(words), size=(count, words_per_chunk), p=probabilities)
+    return [{'page': 1 + i // 4, 'text': " ".join(words[w] for w in row)} for i, row in enumerate(picks)]
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))] * 1e3
+
+
+def run(size, dense, args, words, probabilities, base):
+    directory = os.path.join(base, f"{size}-{'dense' if dense else 'bm25'}")
+    index = DocumentIndex(directory, dense=dense)
+    rng = np.random.default_rng(size)
+    build = 0.0
+    for doc in range(0, size, args.doc_chunks):
+        chunks = make_chunks(min(args.doc_chunks, size - doc), words, probabilities, args.words, rng)
+        start = time.perf_counter()
+        # Snapshot once at the end, as a long upload session would
+        index.add_document(f"doc{doc}", f"doc{doc}.txt", chunks, snapshot=False)
+        build += time.perf_counter() - start
+    start = time.perf_counter()
+    index.save()
+    build += time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = DocumentIndex(directory, dense=dense)
+    load = time.perf_counter() - start
+
+    rng = random.Random(7)
+    # Queries mix common and rare terms, like a question about a document
+    queries = [" ".join(rng.choices(words[:2000], k=3) + rng.choices(words, k=2)) for _ in range(args.queries)]
+    index.search(queries[0], args.k)
+    search, retrieve = [], []
+    for query in queries:
+        t = time.perf_counter()
+        index.search(query, args.k)
+        search.append(time.perf_counter() - t)
+        t = time.perf_counter()
+        index.retrieve(query, args.k, args.max_tokens)
+        retrieve.append(time.perf_counter() - t)
+
+    disk = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory))
+    row = {
+        'chunks': size, 'mode': 'bm25+dense' if dense else 'bm25',
+        'build_seconds': round(build, 2), 'chunks_per_sec': round(size / build),
+        'load_seconds': round(load, 3), 'disk_mb': round(disk / 2 ** 20, 1),
+        'search_p50_ms': round(percentile(search, 0.5), 2),
+        'search_p95_ms': round(percentile(search, 0.95), 2),
+        'retrieve_p50_ms': round(percentile(retrieve, 0.5), 2),
+        'retrieve_p95_ms': round(percentile(retrieve, 0.95), 2)
+    }
+    if not args.keep:
+        shutil.rmtree(directory)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--words", type=int, default=200, help="words per chunk")
+    parser.add_argument("--vocabulary", type=int, default=50000)
+    parser.add_argument("--doc-chunks", type=int, default=500, help="chunks per uploaded document")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--max-tokens", type=int, default=1500)
+    parser.add_argument("--no-dense", action="store_true", help="skip the BM25 + dense runs")
+    parser.add_argument("--output", help="write all results to this JSON file")
+    parser.add_argument("--keep", action="store_true", help="keep the generated indexes")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    words = vocabulary(args.vocabulary, rng)
+    probabilities = 1.0 / np.arange(1, len(words) + 1)
+    probabilities /= probabilities.sum()
+    base = tempfile.mkdtemp(prefix="bench-retrieval-")
+    rows = []
+    print(f"{'chunks':>9}{'mode':>12}{'build s':>9}{'chunk/s':>9}{'load s':>8}{'disk MB':>9}"
+          f"{'search p50':>12}{'p95':>8}{'retrieve p50':>14}{'p95':>8}")
+    for size in args.chunks:
+        for dense in (False,) if args.no_dense else (False, True):
+            row = run(size, dense, args, words, probabilities, base)
+            rows.append(row)
+            print(f"{size:>9}{row['mode']:>12}{row['build_seconds']:>9.1f}{row['chunks_per_sec']:>9}"
+                  f"{row['load_seconds']:>8.2f}{row['disk_mb']:>9.1f}{row['search_p50_ms']:>12.2f}"
+                  f"{row['search_p95_ms']:>8.2f}{row['retrieve_p50_ms']:>14.2f}{row['retrieve_p95_ms']:>8.2f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'words_per_chunk': args.words, 'vocabulary': args.vocabulary, 'results': rows}, f, indent=2)
+        print(f"wrote {len(rows)} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
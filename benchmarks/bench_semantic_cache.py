@@ -0,0 +1,56 @@
+# Lookup latency of the semantic response cache at different fill levels.
+#
+#   python benchmarks/bench_semantic_cache.py --sizes 10000 100000
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from semantic_cache import HashingEmbedder, SemanticCache  # noqa: E402
+
+TOPICS = ("python java rust golang sql docker kubernetes react streamlit pandas numpy "
+          "recursion closures decorators generators asyncio threads sockets http json yaml "
+          "regex sorting hashing caching indexing transactions sharding replication").split()
+TEMPLATES = ("what is {} {}", "explain {} and {}", "how do {} and {} differ",
+             "give an example of {} with {}", "why use {} for {}")
+
+
+def prompt(rng):
+    return rng.choice(TEMPLATES).format(rng.choice(TOPICS), rng.choice(TOPICS)) + f" case {rng.randrange(10**6)}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--lookups", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=512)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    partition = ("llama-3.1-8b-instant", 0.7, None)
+    print(f"{'entries':>10}{'fill s':>10}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}{'matrix MB':>11}")
+    for size in args.sizes:
+        cache = SemanticCache(capacity=size, embedder=HashingEmbedder(args.dim))
+        start = time.perf_counter()
+        for _ in range(size):
+            cache.add(partition, prompt(rng), "cached answer")
+        fill = time.perf_counter() - start
+
+        timings = []
+        for _ in range(args.lookups):
+            query = prompt(rng)
+            t0 = time.perf_counter()
+            cache.lookup(partition, query)
+            timings.append((time.perf_counter() - t0) * 1e3)
+        timings.sort()
+        print(f"{size:>10}{fill:>10.1f}{statistics.mean(timings):>10.3f}"
+              f"{timings[len(timings) // 2]:>10.3f}{timings[int(len(timings) * 0.99)]:>10.3f}"
+              f"{cache.vectors.nbytes / 1e6:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
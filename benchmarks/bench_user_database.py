@@ -0,0 +1,276 @@
+# Micro-benchmarks for the storage backends at production data sizes.
+#
+#   python benchmarks/bench_user_database.py --users 1000 10000 --backends json sqlite
+#   python benchmarks/bench_user_database.py --users 100000 --convs 2 --messages 10 \
+#       --backends json-sharded sqlite --output results.json
+#
+# For every (backend, dataset size) a synthetic store is written to a fresh
+# directory, then a spawned process opens it through create_database() with
+# the backend's settings and times each UserDatabase operation on random
+# users. Each operation is sampled until --ops calls or --op-seconds have
+# passed; peak Python allocation is taken from one extra call under
+# tracemalloc, and max RSS covers the whole run. --output writes all rows
+# as JSON so other backends can be compared against the JSON one.
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import auth  # noqa: E402
+import compact_format  # noqa: E402
+from conversation_log import ConversationLog  # noqa: E402
+from database import UserDatabase, migrate_json_to_sqlite  # noqa: E402
+
+PASSWORD = "benchmark-password"
+WORDS = ("python streamlit model token memory answer question context chat groq "
+         "llama response prompt data file user system value list function error").split()
+
+# create_database() settings for each backend, relative to the data directory
+BACKENDS = {
+    'json': {},
+    'json-sharded': {'DATA_SHARD_DIR': 'data'},
+    'json-logged': {'CONVERSATION_LOG_DIR': 'logs'},
+    'json-compact': {'STORAGE_FORMAT': 'compact'},
+    'sqlite': {'DB_BACKEND': 'sqlite', 'DB_PATH': 'chatbot.db'}
+}
+
+
+def username(i):
+    return f"user{i}@example.com"
+
+
+def make_messages(user, conv, count):
+    rng = random.Random(user * 1000003 + conv)
+    return [
+        ["user" if i % 2 == 0 else "assistant",
+         " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 60)))]
+        for i in range(count)
+    ]
+
+
+def make_conversations(user, args, now):
+    convs = []
+    for c in range(args.convs):
+        # Spread over the retention window, oldest first as the store keeps them
+        created = now - timedelta(minutes=(args.convs - c) * 60 + user % 60)
+        convs.append({
+            'id': f"{user}-{c}",
+            'title': f"chat {c}",
+            'messages': make_messages(user, c, args.messages),
+            'created_at': created.isoformat(),
+            'updated_at': created.isoformat()
+        })
+    return convs
+
+
+def make_context(user, now):
+    topics = [{'message': f"topic {t} of user {user}",
+               'timestamp': (now - timedelta(minutes=50 - t)).isoformat()} for t in range(20)]
+    return {'topics_discussed': topics, 'preferences': {}, 'interaction_count': 20,
+            'last_interaction': topics[-1]['timestamp']}
+
+
+def write_json_map(path, items):
+    # Streams {key: value, ...} so the whole store never sits in memory
+    with open(path, 'w') as f:
+        f.write("{")
+        for n, (key, value) in enumerate(items):
+            f.write((", " if n else "") + json.dumps(key) + ": " + json.dumps(value))
+        f.write("}")
+
+
+def generate(backend, workdir, args, password_hash):
+    now = datetime.now()
+    os.makedirs(workdir)
+    os.chdir(workdir)
+    users = range(args.users)
+    created = now.isoformat()
+    write_json_map("users_data.json", (
+        (username(u), {'password': password_hash, 'created_at': created, 'preferences': {}})
+        for u in users
+    ))
+
+    if backend == 'json-sharded':
+        db = UserDatabase(shard_dir=BACKENDS[backend]['DATA_SHARD_DIR'])
+        for u in users:
+            name = username(u)
+            with open(db.conversations_path(name), 'w') as f:
+                json.dump({name: make_conversations(u, args, now)}, f)
+            with open(db.context_path(name), 'w') as f:
+                json.dump({name: make_context(u, now)}, f)
+        return
+
+    if backend == 'json-logged':
+        log = ConversationLog(BACKENDS[backend]['CONVERSATION_LOG_DIR'])
+
+        def metadata(u):
+            convs = make_conversations(u, args, now)
+            for conv in convs:
+                log.append(log.path(username(u), conv['id']), conv.pop('messages'))
+            return convs
+        write_json_map("conversations_data.json", ((username(u), metadata(u)) for u in users))
+    else:
+        write_json_map("conversations_data.json",
+                       ((username(u), make_conversations(u, args, now)) for u in users))
+    write_json_map("user_context.json", ((username(u), make_context(u, now)) for u in users))
+
+    if backend == 'json-compact':
+        compact_format.json_to_compact("conversations_data.json", "conversations_data" + compact_format.COMPACT_SUFFIX)
+        os.remove("conversations_data.json")
+    elif backend == 'sqlite':
+        migrate_json_to_sqlite(BACKENDS[backend]['DB_PATH'])
+        for name in ("users_data.json", "conversations_data.json", "user_context.json"):
+            os.remove(name)
+
+
+def disk_bytes(workdir):
+    total = 0
+    for root, _, files in os.walk(workdir):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+
+def peak_rss_mb():
+    # ru_maxrss survives exec, so a spawned child would report the parent's
+    # peak; VmHWM belongs to this process image only
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+
+def measure(backend, workdir, args, results):
+    # Runs in a spawned process so memory figures belong to this backend only
+    os.chdir(workdir)
+    os.environ.update(BACKENDS[backend])
+    from database import create_database
+    db = create_database()
+    rng = random.Random(1)
+    new_users = iter(range(args.users, 10 ** 9))
+    # Every sampled delete needs a conversation that still exists
+    deletable = [(u, c) for u in range(args.users) for c in range(args.convs)]
+    rng.shuffle(deletable)
+    deletable = iter(deletable)
+
+    def save(u):
+        conv = rng.randrange(args.convs)
+        messages = make_messages(u, conv, args.messages) + [["user", "one more"], ["assistant", "reply"]]
+        db.save_conversation(username(u), f"{u}-{conv}", messages)
+
+    def delete(_):
+        u, conv = next(deletable)
+        db.delete_conversation(username(u), f"{u}-{conv}")
+
+    operations = [
+        ('verify_user', lambda u: db.verify_user(username(u), PASSWORD), args.kdf_ops),
+        ('create_user', lambda u: db.create_user(username(next(new_users)), PASSWORD), args.kdf_ops),
+        ('get_user_conversations', lambda u: db.get_user_conversations(username(u)), args.ops),
+        ('get_user_context', lambda u: db.get_user_context(username(u)), args.ops),
+        ('update_user_context', lambda u: db.update_user_context(username(u), "benchmark message"), args.ops),
+        ('save_conversation', save, args.ops),
+        ('delete_conversation', delete, min(args.ops, args.users * args.convs - 1)),
+    ]
+    rows = []
+    for name, op, count in operations:
+        samples = []
+        deadline = time.perf_counter() + args.op_seconds
+        for _ in range(count):
+            u = rng.randrange(args.users)
+            start = time.perf_counter()
+            op(u)
+            samples.append((time.perf_counter() - start) * 1e3)
+            if time.perf_counter() > deadline:
+                break
+        tracemalloc.start()
+        op(rng.randrange(args.users))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        samples.sort()
+        rows.append({
+            'op': name,
+            'count': len(samples),
+            'mean_ms': round(statistics.mean(samples), 3),
+            'p50_ms': round(samples[len(samples) // 2], 3),
+            'p95_ms': round(samples[int(len(samples) * 0.95)], 3),
+            'p99_ms': round(samples[int(len(samples) * 0.99)], 3),
+            'ops_per_sec': round(1e3 * len(samples) / sum(samples), 1) if sum(samples) else None,
+            'peak_alloc_kb': round(peak / 1024, 1)
+        })
+    max_rss_mb = peak_rss_mb()
+    results.put([dict(row, max_rss_mb=max_rss_mb) for row in rows])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--convs", type=int, default=5, help="conversations per user")
+    parser.add_argument("--messages", type=int, default=20, help="messages per conversation")
+    parser.add_argument("--backends", nargs="+", choices=sorted(BACKENDS), default=["json", "sqlite"])
+    parser.add_argument("--ops", type=int, default=200, help="max samples per operation")
+    parser.add_argument("--kdf-ops", type=int, default=10, help="max samples for password operations")
+    parser.add_argument("--op-seconds", type=float, default=20.0, help="time budget per operation")
+    parser.add_argument("--output", help="write all results to this JSON file")
+    parser.add_argument("--keep", action="store_true", help="keep the generated data directories")
+    args = parser.parse_args()
+
+    password_hash = auth.hash_password(PASSWORD)
+    base = tempfile.mkdtemp(prefix="bench-db-")
+    spawn = multiprocessing.get_context("spawn")
+    rows = []
+    print(f"{'backend':<14}{'users':>8}{'operation':>24}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}"
+          f"{'p99 ms':>10}{'peak KB':>10}{'rss MB':>8}")
+    for users in args.users:
+        run_args = argparse.Namespace(**vars(args))
+        run_args.users = users
+        for backend in args.backends:
+            workdir = os.path.join(base, f"{backend}-{users}")
+            start = time.perf_counter()
+            generate(backend, workdir, run_args, password_hash)
+            os.chdir(base)
+            setup = time.perf_counter() - start
+            size = disk_bytes(workdir)
+
+            results = spawn.Queue()
+            process = spawn.Process(target=measure, args=(backend, workdir, run_args, results))
+            process.start()
+            measured = results.get()
+            process.join()
+            for row in measured:
+                row.update({'backend': backend, 'users': users,
+                            'conversations': users * args.convs,
+                            'messages': users * args.convs * args.messages,
+                            'disk_bytes': size, 'setup_seconds': round(setup, 2)})
+                rows.append(row)
+                print(f"{backend:<14}{users:>8}{row['op']:>24}{row['count']:>5}{row['p50_ms']:>10.2f}"
+                      f"{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}{row['peak_alloc_kb']:>10.0f}"
+                      f"{row['max_rss_mb']:>8.0f}")
+            if not args.keep:
+                shutil.rmtree(workdir)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'convs_per_user': args.convs, 'messages_per_conv': args.messages,
+                       'results': rows}, f, indent=2)
+        print(f"wrote {len(rows)} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
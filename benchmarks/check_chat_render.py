@@ -0,0 +1,55 @@
+# Expected markdown bodies from chat_render.prepare_markdown, code included.
+#
+#   python benchmarks/check_chat_render.py
+#
+# User text gets its dollar signs escaped and model replies get \( \) and
+# \[ \] turned into Streamlit's $ and $$, but never inside inline code or
+# fenced blocks, which are drawn verbatim. Exits 1 if any case differs.
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_render import prepare_markdown  # noqa: E402
+
+CASES = (
+    ("user", "is it $5 or $10?", r"is it \$5 or \$10?"),
+    ("user", r"already \$5", r"already \$5"),
+    ("user", "```echo $HOME```", "```echo $HOME```"),
+    ("user", "```echo $HOME``` costs $5", r"```echo $HOME``` costs \$5"),
+    ("user", "costs $5, run `echo $HOME`", r"costs \$5, run `echo $HOME`"),
+    ("user", "```bash\necho $HOME\n```\nthat was $5", "```bash\necho $HOME\n```\nthat was \\$5"),
+    ("user", "~~~\nprice=$5\n~~~", "~~~\nprice=$5\n~~~"),
+    ("user", "```python\nprint('$x')", "```python\nprint('$x')"),
+    ("user", "``a ` $b``", "``a ` $b``"),
+    ("assistant", r"The area is \(\pi r^2\).", r"The area is $\pi r^2$."),
+    ("assistant", r"\[x^2 + y^2\]", "$$x^2 + y^2$$"),
+    ("assistant", r'Use `re.compile(r"\(\d+\)")` here', r'Use `re.compile(r"\(\d+\)")` here'),
+    ("assistant", r"`\[a-z\]` matches \(a\)", r"`\[a-z\]` matches $a$"),
+    ("assistant", "```python\npattern = r\"\\(\\d+\\)\"\n```\nso \\(n\\) digits",
+     "```python\npattern = r\"\\(\\d+\\)\"\n```\nso $n$ digits"),
+    ("assistant", "~~~\n\\(kept\\)\n~~~\n\\(x\\)", "~~~\n\\(kept\\)\n~~~\n$x$"),
+    ("assistant", "plain text", "plain text"),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--verbose", action="store_true", help="print every case")
+    args = parser.parse_args()
+
+    failures = 0
+    for role, text, expected in CASES:
+        body = prepare_markdown(role, text)
+        if body != expected:
+            failures += 1
+        if args.verbose or body != expected:
+            print(f"{'ok  ' if body == expected else 'FAIL'} {role:<9} {text!r} -> {body!r}"
+                  + ("" if body == expected else f" (expected {expected!r})"))
+    print(f"{len(CASES) - failures}/{len(CASES)} cases as expected")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# Labelled paraphrase and non-paraphrase pairs for the semantic cache.
+#
+#   python benchmarks/check_semantic_cache.py
+#   python benchmarks/check_semantic_cache.py --threshold 0.85 --verbose
+#
+# Each pair is cached under one prompt and looked up with the other, in both
+# directions. A paraphrase must hit and a different question must miss;
+# exits 1 if any pair does otherwise. Run it after changing the tokenizer,
+# the embedder or SEMANTIC_CACHE_THRESHOLD.
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from semantic_cache import SemanticCache  # noqa: E402
+
+PARAPHRASES = (
+    ("what is python", "explain python to me"),
+    ("what is python", "what's python?"),
+    ("what is python", "What is Python?"),
+    ("what is python", "tell me about python"),
+    ("what are decorators in python", "explain python decorators"),
+    ("how do I reverse a list in python", "how can I reverse a python list"),
+    ("how do I reverse a list in python", "how to reverse a list in python"),
+    ("how do i sort a dictionary by value", "what's the best way to sort a dictionary by value"),
+    ("how to read a file line by line in python", "how can I read a file line by line in python?"),
+    ("explain the difference between a list and a tuple", "what is the difference between list and tuple"),
+    ("what is the capital of france", "tell me the capital of france"),
+    ("what is recursion", "can you explain recursion please"),
+    ("why is my python code slow", "why is my python code so slow?"),
+    ("how does garbage collection work in java", "how does java garbage collection work"),
+    ("what is 3+5", "what's 3 + 5?"),
+    ("how do I convert a string to an int in python", "how to convert string to int in python"),
+    ("give me an overview of kubernetes", "describe kubernetes"),
+    ("what does HTTP stand for", "what does http stand for?"),
+    ("what is the capital of france", "what is the capital city of france"),
+    ("how do I reverse a list in python", "how do I quickly reverse a list in python"),
+    ("explain python decorators", "explain python decorators with examples"),
+)
+
+DIFFERENT = (
+    ("what is python", "why python"),
+    ("explain python to me", "why python"),
+    ("what is 3+5", "what is 3*5"),
+    ("what is 2^10", "what is 2*10"),
+    ("what is c", "what is c++"),
+    ("what is c++", "what is c#"),
+    ("how do I convert a string to an int", "how do I convert an int to a string"),
+    ("what is the capital of france", "what is the capital of germany"),
+    ("how do I sort a list in python", "how do I sort a list in java"),
+    ("how do I reverse a list in python", "how do I reverse a string in python"),
+    ("why is my code slow", "why is my code not slow"),
+    ("can I use threads in python", "I can't use threads in python"),
+    ("what is a list", "how do I make a list"),
+    ("explain python decorators", "explain python generators"),
+    ("what is docker", "what is kubernetes"),
+    ("how does a hash map work", "how does a tree map work"),
+    ("what is the time complexity of quicksort", "what is the time complexity of mergesort"),
+    ("what is python 2", "what is python 3"),
+    ("write a poem about cats", "write a poem about dogs"),
+    ("compare rust and go", "compare rust and c++"),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threshold", type=float, help="default: SemanticCache's own")
+    parser.add_argument("--verbose", action="store_true", help="print every pair with its score")
+    args = parser.parse_args()
+
+    partition = ("llama-3.1-8b-instant", 0.7, None)
+    failures = 0
+    for expected, pairs in ((True, PARAPHRASES), (False, DIFFERENT)):
+        for first, second in pairs:
+            for cached, asked in ((first, second), (second, first)):
+                cache = SemanticCache(capacity=4)
+                if args.threshold is not None:
+                    cache.threshold = args.threshold
+                cache.add(partition, cached, "answer")
+                hit = cache.lookup(partition, asked) is not None
+                score = float(cache.vectors[0] @ cache.embedder.embed(asked))
+                if hit != expected:
+                    failures += 1
+                if args.verbose or hit != expected:
+                    status = "ok  " if hit == expected else "FAIL"
+                    print(f"{status} {'hit ' if hit else 'miss'} {score:5.2f}  {cached!r} -> {asked!r}")
+    total = 2 * (len(PARAPHRASES) + len(DIFFERENT))
+    print(f"{total - failures}/{total} lookups as expected (threshold {cache.threshold})")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+# Concurrent-session load test against the offline fake LLM.
+#
+#   python benchmarks/load_test.py --users 20 --turns 3
+#   python benchmarks/load_test.py --mode app --users 8 --turns 2 --json
+#
+# Every simulated user signs up, logs in, chats, starts a new chat, reopens
+# the first one and deletes it. "db" mode drives create_database() and a
+# ConversationChain directly from threads; "app" mode drives app.py through
+# Streamlit's AppTest, so the whole script (caches, router, scheduler) is on
+# the path. AppTest is not thread-safe, so app mode spreads users over worker
+# processes, each acting like one server replica on the shared data files.
+# Data goes to a temporary directory and DB_BACKEND etc. are taken from the
+# environment as in the app. Prints p50/p95/p99 per operation and
+# throughput; --json prints the same as one JSON object.
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+TOPICS = ("python java rust sql docker streamlit pandas numpy recursion decorators "
+          "asyncio sockets http json regex sorting hashing caching indexing sharding").split()
+
+
+class Timings:
+    def __init__(self):
+        self.samples = {}
+        self.failures = {}
+        self._lock = threading.Lock()
+
+    def timed(self, op, fn, *args):
+        start = time.perf_counter()
+        try:
+            result = fn(*args)
+        except Exception:
+            with self._lock:
+                self.failures[op] = self.failures.get(op, 0) + 1
+            raise
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.samples.setdefault(op, []).append(elapsed)
+        return result
+
+    def merge(self, samples, failures):
+        with self._lock:
+            for op, values in samples.items():
+                self.samples.setdefault(op, []).extend(values)
+            for op, count in failures.items():
+                self.failures[op] = self.failures.get(op, 0) + count
+
+    def report(self, wall):
+        ops = {}
+        for op, values in self.samples.items():
+            values = sorted(values)
+            pick = lambda q: values[min(len(values) - 1, int(q * len(values)))] * 1e3  # noqa: E731
+            ops[op] = {
+                'count': len(values),
+                'failures': self.failures.get(op, 0),
+                'p50_ms': round(pick(0.50), 2),
+                'p95_ms': round(pick(0.95), 2),
+                'p99_ms': round(pick(0.99), 2),
+                'ops_per_sec': round(len(values) / wall, 2)
+            }
+        for op, count in self.failures.items():
+            ops.setdefault(op, {'count': 0, 'failures': count})
+        total = sum(len(v) for v in self.samples.values())
+        return {'wall_seconds': round(wall, 3), 'operations': total,
+                'throughput_ops_per_sec': round(total / wall, 2), 'ops': ops}
+
+
+def prompt(user, turn):
+    return f"user {user} turn {turn}: explain {TOPICS[(user + turn) % len(TOPICS)]} " \
+           f"with {TOPICS[(user * 7 + turn) % len(TOPICS)]}"
+
+
+def db_user(i, args, db, timings):
+    from langchain_classic.chains import ConversationChain
+    from langchain_classic.memory import ConversationBufferMemory
+
+    from llm_clients import get_llm
+
+    email, password = f"load{i}@example.com", "secret-password"
+    timings.timed('signup', db.create_user, email, password)
+    timings.timed('login', db.verify_user, email, password)
+
+    def chat(conv_id, history, text):
+        db.update_user_context(email, text)
+        history.append(("user", text))
+        history.append(("assistant", chain.predict(input=text)))
+        db.save_conversation(email, conv_id, history, text[:30] if len(history) == 2 else "Chat")
+
+    chain = ConversationChain(llm=get_llm(args.model, 0.7), memory=ConversationBufferMemory())
+    first, history = f"{i}-first", []
+    for turn in range(args.turns):
+        timings.timed('chat', chat, first, history, prompt(i, turn))
+
+    chain = ConversationChain(llm=get_llm(args.model, 0.7), memory=ConversationBufferMemory())
+    timings.timed('chat', chat, f"{i}-second", [], prompt(i, args.turns))
+
+    def reopen():
+        listed = db.list_conversations(email, limit=20)
+        return db.get_conversation(email, listed[-1]['id'])
+    opened = timings.timed('reopen', reopen)
+    if opened is None or len(opened['messages']) != 2 * args.turns:
+        raise AssertionError(f"user {i} reopened {opened and len(opened['messages'])} messages")
+    timings.timed('delete', db.delete_conversation, email, first)
+
+
+def app_user(i, args, timings):
+    from streamlit.testing.v1 import AppTest
+
+    def run(at):
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+        return at
+
+    def button(at, label):
+        return next(b for b in at.button if b.label.strip() == label)
+
+    email, password = f"load{i}@example.com", "secret-password"
+    at = AppTest.from_file(os.path.join(REPO, "app.py"), default_timeout=args.timeout)
+    timings.timed('load', run, at)
+
+    at.text_input(key="signup_email").input(email)
+    at.text_input(key="signup_pass").input(password)
+    at.text_input(key="confirm_pass").input(password)
+    next(c for c in at.checkbox if "Terms" in c.label).check()
+    button(at, "Create account").click()
+    timings.timed('signup', run, at)
+
+    at.text_input[0].input(email)
+    at.text_input[1].input(password)
+    button(at, "Sign in").click()
+    timings.timed('login', run, at)
+    if not at.session_state.logged_in:
+        raise AssertionError(f"user {i} could not log in")
+
+    for turn in range(args.turns):
+        at.chat_input[0].set_value(prompt(i, turn))
+        timings.timed('chat', run, at)
+    first = at.session_state.current_conv_id
+
+    button(at, "New Chat").click()
+    timings.timed('new_chat', run, at)
+    at.chat_input[0].set_value(prompt(i, args.turns))
+    timings.timed('chat', run, at)
+
+    at.button(key=f"load_{first}").click()
+    timings.timed('reopen', run, at)
+    if len(at.session_state.chat_history) != 2 * args.turns:
+        raise AssertionError(f"user {i} reopened {len(at.session_state.chat_history)} messages")
+    # Reopening reruns only the chat pane fragment, after which AppTest holds
+    # just that fragment's elements; a full run (untimed) brings the sidebar back
+    run(at)
+    at.button(key=f"del_{first}").click()
+    timings.timed('delete', run, at)
+
+
+def app_worker(users, args):
+    # One task per process: AppTest replaces __main__, which breaks
+    # unpickling of any later task sent to the same worker
+    timings = Timings()
+    errors = []
+    for i in users:
+        try:
+            app_user(i, args, timings)
+        except Exception as exc:
+            errors.append(f"user {i}: {exc!r}")
+    return timings.samples, timings.failures, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mode", choices=("db", "app"), default="db")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8, help="users in flight at once")
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--model", default="llama-3.1-8b-instant")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake first-token latency (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=500)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=60, help="AppTest run timeout (s)")
+    parser.add_argument("--json", action="store_true", help="print one JSON object")
+    args = parser.parse_args()
+
+    os.environ.update({
+        "LLM_BACKEND": "fake",
+        "FAKE_LLM_LATENCY_SECONDS": str(args.latency),
+        "FAKE_LLM_TOKENS_PER_SECOND": str(args.tokens_per_second),
+        "FAKE_LLM_ERROR_RATE": str(args.error_rate)
+    })
+    os.environ.setdefault("GROQ_API_KEY", "load-test")
+    # The app's default request budget is sized for the real provider
+    os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "0")
+    workdir = tempfile.mkdtemp(prefix="load-")
+    os.chdir(workdir)
+
+    timings = Timings()
+    errors = []
+    start = time.perf_counter()
+    if args.mode == "db":
+        from database import create_database
+        db = create_database()
+
+        def user(i):
+            try:
+                db_user(i, args, db, timings)
+            except Exception as exc:
+                errors.append(f"user {i}: {exc!r}")
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(user, range(args.users)))
+    else:
+        shares = [range(w, args.users, args.concurrency) for w in range(args.concurrency)]
+        with ProcessPoolExecutor(max_workers=args.concurrency) as pool:
+            for samples, failures, worker_errors in pool.map(app_worker, shares, [args] * len(shares)):
+                timings.merge(samples, failures)
+                errors.extend(worker_errors)
+    report = timings.report(time.perf_counter() - start)
+    report.update({'mode': args.mode, 'users': args.users, 'concurrency': args.concurrency,
+                   'turns': args.turns, 'failed_users': len(errors), 'dir': workdir})
+
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print(f"mode={args.mode} users={args.users} concurrency={args.concurrency} "
+              f"turns={args.turns} dir={workdir}")
+        print(f"{'operation':<10}{'count':>7}{'fail':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>9}")
+        for op, s in report['ops'].items():
+            if s['count']:
+                print(f"{op:<10}{s['count']:>7}{s['failures']:>6}{s['p50_ms']:>10.1f}"
+                      f"{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}{s['ops_per_sec']:>9.1f}")
+        print(f"{report['operations']} operations in {report['wall_seconds']:.2f}s, "
+              f"{report['throughput_ops_per_sec']:.1f} ops/s")
+        for error in errors[:5]:
+            print("FAIL:", error)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
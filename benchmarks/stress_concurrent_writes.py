@@ -0,0 +1,94 @@
+# Concurrent writer stress test for the JSON backend.
+#
+#   python benchmarks/stress_concurrent_writes.py --workers 16 --ops 50
+#
+# Every worker process bumps the shared user's context, saves its own
+# conversations for that user and for a private user, then the totals are
+# checked. Any lost update or unreadable file makes the script exit non-zero.
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import UserDatabase  # noqa: E402
+
+
+def make_db(args):
+    return UserDatabase(
+        log_dir=args.log_dir,
+        shard_dir=args.shard_dir
+    )
+
+
+def writer(worker_id, args):
+    os.chdir(args.workdir)
+    db = make_db(args)
+    own_user = f"user-{worker_id}"
+    for i in range(args.ops):
+        db.update_user_context("shared", f"worker {worker_id} op {i}")
+        db.update_user_context(own_user, f"op {i}")
+        messages = [("user", f"q{i}"), ("assistant", f"a{i}")]
+        db.save_conversation("shared", f"{worker_id}-{i}", messages, f"chat {i}")
+        db.save_conversation(own_user, "only", messages * (i + 1), "mine")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--ops", type=int, default=50)
+    parser.add_argument("--sharded", action="store_true", help="use per-user shard files")
+    parser.add_argument("--logged", action="store_true", help="use append-only message logs")
+    args = parser.parse_args()
+
+    args.workdir = tempfile.mkdtemp(prefix="stress-")
+    args.shard_dir = os.path.join(args.workdir, "data") if args.sharded else None
+    args.log_dir = os.path.join(args.workdir, "logs") if args.logged else None
+    os.chdir(args.workdir)
+    make_db(args)
+
+    processes = [
+        multiprocessing.Process(target=writer, args=(worker_id, args))
+        for worker_id in range(args.workers)
+    ]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+    failed = [p.exitcode for p in processes if p.exitcode != 0]
+
+    db = make_db(args)
+    errors = []
+    if failed:
+        errors.append(f"{len(failed)} writer processes crashed")
+
+    expected = args.workers * args.ops
+    shared = db.get_user_context("shared")
+    if shared['interaction_count'] != expected:
+        errors.append(f"shared interaction_count {shared['interaction_count']} != {expected}")
+    conversations = db.get_user_conversations("shared")
+    if len(conversations) != expected:
+        errors.append(f"shared conversations {len(conversations)} != {expected}")
+
+    for worker_id in range(args.workers):
+        own_user = f"user-{worker_id}"
+        count = db.get_user_context(own_user)['interaction_count']
+        if count != args.ops:
+            errors.append(f"{own_user} interaction_count {count} != {args.ops}")
+        own = db.get_user_conversations(own_user)
+        if len(own) != 1 or len(own[0]['messages']) != 2 * args.ops:
+            errors.append(f"{own_user} conversation lost messages")
+
+    print(f"workers={args.workers} ops={args.ops} sharded={args.sharded} "
+          f"logged={args.logged} dir={args.workdir}")
+    if errors:
+        for error in errors:
+            print("FAIL:", error)
+        sys.exit(1)
+    print("OK: no lost updates")
+
+
+if __name__ == "__main__":
+    main()
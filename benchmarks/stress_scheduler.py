@@ -0,0 +1,105 @@
+# Stress test for the LLM request scheduler with a flaky fake model.
+#
+#   python benchmarks/stress_scheduler.py --users 8 --threads 32 --requests 300
+#
+# Threads send ConversationChain.predict calls for a handful of users through
+# one RequestScheduler while the fake model fails a share of calls with
+# groq.RateLimitError. Exits non-zero if a call is lost after retries, a user
+# exceeds the concurrency cap, or the request rate goes over the budget.
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_classic.chains import ConversationChain  # noqa: E402
+from langchain_classic.memory import ConversationBufferMemory  # noqa: E402
+
+from fake_llm import FakeChatModel  # noqa: E402
+from llm_scheduler import RequestScheduler  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--rpm", type=int, default=3000)
+    parser.add_argument("--user-limit", type=int, default=2)
+    parser.add_argument("--error-rate", type=float, default=0.3)
+    parser.add_argument("--latency", type=float, default=0.01)
+    args = parser.parse_args()
+    # Every injected 429 would otherwise log a retry warning
+    logging.getLogger("llm_scheduler").setLevel(logging.ERROR)
+
+    llm = FakeChatModel(latency=args.latency, tokens_per_second=0, reply_words=5, error_rate=args.error_rate)
+    scheduler = RequestScheduler(
+        requests_per_minute=args.rpm,
+        per_user_limit=args.user_limit,
+        max_retries=10,
+        backoff_seconds=0.01,
+        max_backoff_seconds=0.2,
+        burst_seconds=1.0
+    )
+    active = {}
+    peak = {}
+    lock = threading.Lock()
+
+    def one_request(i):
+        user = f"user-{i % args.users}"
+        chain = ConversationChain(llm=llm, memory=ConversationBufferMemory())
+
+        def call():
+            with lock:
+                active[user] = active.get(user, 0) + 1
+                peak[user] = max(peak.get(user, 0), active[user])
+            try:
+                return chain.predict(input=f"question {i}")
+            finally:
+                with lock:
+                    active[user] -= 1
+
+        return scheduler.run(user, call, tokens=50)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(lambda i: _capture(one_request, i), range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    errors = []
+    failures = [r for r in results if isinstance(r, Exception)]
+    if failures:
+        errors.append(f"{len(failures)} requests failed after retries: {failures[0]!r}")
+    over_cap = {user: n for user, n in peak.items() if n > args.user_limit}
+    if over_cap:
+        errors.append(f"per-user concurrency exceeded: {over_cap}")
+    allowed = scheduler.requests.capacity + args.rpm / 60.0 * elapsed + 1
+    if llm.calls > allowed:
+        errors.append(f"{llm.calls} model calls in {elapsed:.2f}s exceeds budget of {allowed:.0f}")
+
+    stats = scheduler.stats()
+    print(f"requests={args.requests} users={args.users} threads={args.threads} "
+          f"error_rate={args.error_rate} rpm={args.rpm}")
+    print(f"elapsed {elapsed:.2f}s, {args.requests / elapsed:.1f} req/s, {llm.calls} model calls")
+    print(f"retries={stats['retries']} failed={stats['failed']} peak_queued={stats['peak_queued']} "
+          f"throttled={stats['throttled_seconds']:.2f}s peak per-user concurrency={max(peak.values())}")
+    if errors:
+        for error in errors:
+            print("FAIL:", error)
+        sys.exit(1)
+    print("OK")
+
+
+def _capture(fn, *args):
+    try:
+        return fn(*args)
+    except Exception as exc:
+        return exc
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import logging
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from langchain_classic.memory import ConversationSummaryBufferMemory
+
+logger = logging.getLogger(__name__)
+
+# Per-message overhead for role prefixes and separators
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English text; no tokenizer download needed
+    return len(text) // 4 + 1
+
+
+# Keeps the most recent turns verbatim within max_token_limit and folds older
+# turns into a rolling summary. The summary is extended with just the pruned
+# turns (summary + new lines), never rebuilt from the full transcript.
+class TokenBudgetMemory(ConversationSummaryBufferMemory):
+    # Runs the summary call as summarize(call, tokens), e.g. through the LLM
+    # scheduler so it shares the rate budget and retries of replies
+    summarize: Optional[Callable] = None
+
+    def buffer_tokens(self):
+        total = sum(estimate_tokens(m.content) + MESSAGE_OVERHEAD_TOKENS
+                    for m in self.chat_memory.messages)
+        return total + estimate_tokens(self.moving_summary_buffer)
+
+    def prune(self):
+        buffer = self.chat_memory.messages
+        lengths = [estimate_tokens(m.content) + MESSAGE_OVERHEAD_TOKENS for m in buffer]
+        total = sum(lengths) + estimate_tokens(self.moving_summary_buffer)
+        if total <= self.max_token_limit:
+            return
+
+        # Drop whole human/AI turns from the front, always keeping the latest
+        pruned = []
+        pruned_tokens = 0
+        while total > self.max_token_limit and len(buffer) > 2:
+            for _ in range(2):
+                pruned.append(buffer.pop(0))
+                pruned_tokens += lengths[0]
+                total -= lengths.pop(0)
+        if not pruned:
+            return
+        summary = self.moving_summary_buffer
+
+        def call():
+            return self.predict_new_summary(pruned, summary)
+
+        try:
+            if self.summarize is None:
+                self.moving_summary_buffer = call()
+            else:
+                self.moving_summary_buffer = self.summarize(call, pruned_tokens + 2 * estimate_tokens(summary))
+        except Exception:
+            # The reply already went out; losing detail beats failing the turn
+            logger.warning("summary update failed; dropping %d old messages", len(pruned), exc_info=True)
+
+
+def prompt_tokens(chain, user_input):
+    # Estimated size of the prompt the chain is about to send for this turn
+    inputs = chain.prep_inputs({chain.input_key: user_input})
+    text = chain.prompt.format(**{k: inputs[k] for k in chain.prompt.input_variables})
+    return estimate_tokens(text)
+
+
+def load_messages(memory, messages, max_tokens):
+    # Rebuild memory from a stored transcript, newest turns first, stopping at
+    # max_tokens. Messages go straight into the buffer, so no summary call is
+    # made and older turns beyond the budget are left out.
+    keep = []
+    total = 0
+    for start in range(len(messages) - len(messages) % 2 - 2, -1, -2):
+        turn = messages[start:start + 2]
+        cost = sum(estimate_tokens(text) + MESSAGE_OVERHEAD_TOKENS for _, text in turn)
+        if keep and total + cost > max_tokens:
+            break
+        keep[:0] = turn
+        total += cost
+    for role, text in keep:
+        if role == "user":
+            memory.chat_memory.add_user_message(text)
+        else:
+            memory.chat_memory.add_ai_message(text)
+    return len(keep)
+
+
+# Per-session LRU of built chains, so switching between chats reuses their
+# memory instead of rebuilding it from storage
+class ChainCache:
+    def __init__(self, maxsize=8):
+        self.maxsize = maxsize
+        self._chains = OrderedDict()
+
+    def get(self, key):
+        chain = self._chains.get(key)
+        if chain is not None:
+            self._chains.move_to_end(key)
+        return chain
+
+    def put(self, key, chain):
+        self._chains[key] = chain
+        self._chains.move_to_end(key)
+        while len(self._chains) > self.maxsize:
+            self._chains.popitem(last=False)
+
+    def discard(self, conv_id):
+        for key in [k for k in self._chains if k[0] == conv_id]:
+            del self._chains[key]
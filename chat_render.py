@@ -0,0 +1,76 @@
+import re
+from collections import OrderedDict
+
+_INLINE_MATH = re.compile(r"\\\((.+?)\\\)", re.S)
+_BLOCK_MATH = re.compile(r"\\\[(.+?)\\\]", re.S)
+_DOLLAR = re.compile(r"(?<!\\)\$")
+# Code is drawn verbatim, so nothing inside it is rewritten: fenced blocks
+# (an unclosed fence runs to the end) and inline spans of any backtick count
+_CODE = re.compile(
+    r"^[ ]{0,3}(?P<fence>`{3,}|~{3,})[^`\n]*\n(?:.*?\n)??[ ]{0,3}(?P=fence)[`~]*[ \t]*$"
+    r"|^[ ]{0,3}(?:`{3,}|~{3,})[^`\n]*\n.*"
+    r"|(?P<ticks>`+)(?!`).+?(?<!`)(?P=ticks)(?!`)",
+    re.M | re.S
+)
+
+
+def _outside_code(text, rewrite):
+    parts, last = [], 0
+    for match in _CODE.finditer(text):
+        parts.append(rewrite(text[last:match.start()]))
+        parts.append(match.group(0))
+        last = match.end()
+    parts.append(rewrite(text[last:]))
+    return "".join(parts)
+
+
+def _user_text(text):
+    return _DOLLAR.sub(r"\\$", text)
+
+
+def _model_text(text):
+    text = _BLOCK_MATH.sub(lambda m: "$$" + m.group(1) + "$$", text)
+    return _INLINE_MATH.sub(lambda m: "$" + m.group(1).strip() + "$", text)
+
+
+def prepare_markdown(role, text):
+    # Streamlit reads $...$ as LaTeX: a user's "$5 or $10" must stay literal,
+    # while model replies often write math as \( \) and \[ \], which it
+    # does not render. Code spans and blocks are left as written.
+    if "`" not in text and "~~~" not in text:
+        return _user_text(text) if role == "user" else _model_text(text)
+    return _outside_code(text, _user_text if role == "user" else _model_text)
+
+
+# Markdown bodies of past messages, prepared once. History messages never
+# change and keep their string objects across reruns, so the (role, text)
+# key hashes and compares in constant time after the first lookup.
+class RenderCache:
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, role, text):
+        key = (role, text)
+        body = self._entries.get(key)
+        if body is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+        self.misses += 1
+        body = self._entries[key] = prepare_markdown(role, text)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return body
+
+
+def window_start(count, size):
+    # Index of the first message shown when the last `size` are visible;
+    # size 0 shows everything. Starts on a user turn so a reply is never
+    # shown without its question.
+    if size <= 0 or count <= size:
+        return 0
+    start = count - size
+    return start + (start % 2)
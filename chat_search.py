@@ -0,0 +1,278 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime
+
+from file_store import atomic_write, locked
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have i if in is it its of on or so
+that the this to was were what when which who will with you your
+""".split())
+SNIPPET_CHARS = 160
+
+
+def tokenize(text):
+    return [w for w in _TOKEN.findall(text.lower()) if w not in STOPWORDS]
+
+
+def message_digest(message):
+    return hashlib.sha1(json.dumps(list(message)).encode()).hexdigest()[:16]
+
+
+def snippet(text, terms, width=SNIPPET_CHARS):
+    # Window of `width` characters around the first query term found
+    lower = text.lower()
+    hits = [m.start() for m in (re.search(r"\b" + re.escape(t), lower) for t in terms) if m]
+    start = max(min(hits) - width // 4, 0) if hits else 0
+    if start:
+        space = text.find(" ", start)
+        start = space + 1 if 0 <= space < start + 20 else start
+    end = start + width
+    return ("…" if start else "") + text[start:end].strip() + ("…" if end < len(text) else "")
+
+
+# One user's index. The log file is the only copy on disk: a header line per
+# conversation, one line per message and a line per deletion. It is replayed
+# into postings on load and rewritten without the dead lines once they
+# outnumber the live ones, or right away when conversations are deleted so
+# their text does not stay on disk. Postings are keyed by message id, with
+# the line offset kept beside it, so a rewrite only moves the offsets.
+# Message text is read back by offset for snippets.
+class _UserIndex:
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        self.convs = {}
+        self.postings = {}
+        self.lengths = {}
+        self.offsets = {}
+        self.next_id = 0
+        self.total_length = 0
+        self.dead = 0
+        self.size = 0
+        self.inode = None
+        self.replay()
+
+    def replay(self):
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            if st.st_ino != self.inode or st.st_size < self.size:
+                # Rewritten by a compaction elsewhere; offsets are stale
+                if self.inode is not None:
+                    self.load()
+                    return
+                self.inode = st.st_ino
+            f.seek(self.size)
+            offset = self.size
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self.apply(record, offset)
+                offset += len(line)
+            self.size = offset
+
+    def apply(self, record, offset):
+        conv_id = record['conv']
+        if 'deleted' in record:
+            self.drop(conv_id)
+            self.dead += 1
+        elif 'title' in record:
+            self.drop(conv_id)
+            self.convs[conv_id] = {'title': record['title'], 'created_at': record['created_at'],
+                                   'messages': [], 'last': None}
+        else:
+            conv = self.convs[conv_id]
+            message_id = self.next_id
+            self.next_id += 1
+            conv['messages'].append(message_id)
+            conv['last'] = record['digest']
+            counts = Counter(tokenize(record['text']))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, {})[message_id] = tf
+            length = sum(counts.values())
+            # The terms are kept so dropping a message needs no read
+            self.lengths[message_id] = (conv_id, length, tuple(counts))
+            self.offsets[message_id] = offset
+            self.total_length += length
+
+    def drop(self, conv_id):
+        conv = self.convs.pop(conv_id, None)
+        if conv is None:
+            return
+        self.dead += 1 + len(conv['messages'])
+        for message_id in conv['messages']:
+            _, length, terms = self.lengths.pop(message_id)
+            del self.offsets[message_id]
+            self.total_length -= length
+            for term in terms:
+                postings = self.postings.get(term)
+                if postings is not None and postings.pop(message_id, None) is not None and not postings:
+                    del self.postings[term]
+
+    def read(self, offset):
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def append(self, records):
+        data = "".join(json.dumps(r) + "\n" for r in records).encode()
+        with open(self.path, 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self.replay()
+
+    def compact(self):
+        # One pass over the file copies the live lines, each conversation's
+        # header just before its first message
+        live = {offset: message_id for message_id, offset in self.offsets.items()}
+        headers = {conv_id: (json.dumps({'conv': conv_id, 'title': conv['title'],
+                                         'created_at': conv['created_at']}) + "\n").encode()
+                   for conv_id, conv in self.convs.items()}
+        moved = {}
+
+        def write(out):
+            with open(self.path, 'rb') as f:
+                offset = 0
+                for line in f:
+                    if offset >= self.size:
+                        break
+                    message_id = live.get(offset)
+                    if message_id is not None:
+                        header = headers.pop(self.lengths[message_id][0], None)
+                        if header:
+                            out.write(header)
+                        moved[message_id] = out.tell()
+                        out.write(line)
+                    offset += len(line)
+            for header in headers.values():
+                out.write(header)
+
+        atomic_write(self.path, write, mode='wb')
+        st = os.stat(self.path)
+        self.size, self.inode = st.st_size, st.st_ino
+        self.offsets = moved
+        self.dead = 0
+
+    def search(self, terms, limit, cutoff):
+        # BM25 per message; a conversation ranks by its best message
+        n = len(self.lengths)
+        if not n:
+            return []
+        average = self.total_length / n
+        scores = {}
+        for term in set(terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for message_id, tf in postings.items():
+                norm = self.K1 * (1 - self.B + self.B * self.lengths[message_id][1] / average)
+                scores[message_id] = scores.get(message_id, 0.0) + idf * tf * (self.K1 + 1) / (tf + norm)
+        best = {}
+        for message_id, score in scores.items():
+            conv_id = self.lengths[message_id][0]
+            if self.convs[conv_id]['created_at'] <= cutoff:
+                continue
+            if conv_id not in best or score > best[conv_id][1]:
+                best[conv_id] = (message_id, score)
+        ranked = sorted(best.items(), key=lambda item: -item[1][1])[:limit]
+        return [(conv_id, self.offsets[message_id], score) for conv_id, (message_id, score) in ranked]
+
+
+# Full-text search over chat history with one index file per user, kept up
+# to date by the storage backend on every save and delete. Saves normally
+# only add the new tail of a conversation; an edited history is reindexed.
+class ChatSearchIndex:
+    def __init__(self, directory, max_loaded=64):
+        self.directory = directory
+        self.max_loaded = max_loaded
+        os.makedirs(directory, exist_ok=True)
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def path(self, username):
+        return os.path.join(self.directory, hashlib.sha1(username.encode()).hexdigest() + ".jsonl")
+
+    def user_index(self, username):
+        with self._lock:
+            index = self._indexes.get(username)
+            if index is not None:
+                self._indexes.move_to_end(username)
+                return index
+            index = self._indexes[username] = _UserIndex(self.path(username))
+            while len(self._indexes) > self.max_loaded:
+                self._indexes.popitem(last=False)
+            return index
+
+    def update(self, username, conv_id, messages, title="New Chat", created_at=None):
+        index = self.user_index(username)
+        with index.lock, locked(index.path):
+            index.replay()
+            conv = index.convs.get(conv_id)
+            records = []
+            start = 0
+            if conv is not None:
+                count = len(conv['messages'])
+                if count <= len(messages) and (not count or conv['last'] == message_digest(messages[count - 1])):
+                    start = count
+                else:
+                    records.append({'conv': conv_id, 'deleted': True})
+                    conv = None
+            if conv is None:
+                records.append({'conv': conv_id, 'title': title,
+                                'created_at': created_at or datetime.now().isoformat()})
+            for seq, message in enumerate(messages[start:], start=start):
+                records.append({'conv': conv_id, 'seq': seq, 'role': message[0], 'text': message[1],
+                                'digest': message_digest(message)})
+            if records:
+                index.append(records)
+            self._maybe_compact(index)
+
+    def delete(self, username, conv_ids):
+        index = self.user_index(username)
+        with index.lock, locked(index.path):
+            index.replay()
+            records = [{'conv': c, 'deleted': True} for c in conv_ids if c in index.convs]
+            if records:
+                index.append(records)
+                index.compact()
+
+    def _maybe_compact(self, index):
+        if index.dead > 256 and index.dead > len(index.lengths):
+            index.compact()
+
+    def search(self, username, query, limit=10, cutoff=""):
+        # [{'id', 'title', 'role', 'snippet', 'score'}], best first
+        terms = tokenize(query)
+        if not terms or not os.path.exists(self.path(username)):
+            return []
+        index = self.user_index(username)
+        with index.lock:
+            index.replay()
+            hits = index.search(terms, limit, cutoff)
+            results = []
+            for conv_id, offset, score in hits:
+                record = index.read(offset)
+                results.append({'id': conv_id, 'title': index.convs[conv_id]['title'],
+                                'role': record['role'], 'snippet': snippet(record['text'], terms),
+                                'score': round(score, 3)})
+            return results
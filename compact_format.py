@@ -0,0 +1,215 @@
+import argparse
+import json
+import struct
+import sys
+import zlib
+from array import array
+from itertools import accumulate
+
+from file_store import atomic_write
+
+# Compact on-disk format for conversation stores.
+#
+#   MAGIC | frame* | index | index offset (u64) | MAGIC
+#
+# Each frame is one zlib-compressed conversation, so a single conversation can
+# be decoded on its own. The index maps (username, conv id) to frame offsets.
+MAGIC = b"IYC1"
+COMPACT_SUFFIX = ".iyc"
+ROLES = {'user': 0, 'assistant': 1}
+ROLE_NAMES = {code: role for role, code in ROLES.items()}
+OTHER_ROLE = 255
+CONV_FIELDS = ('id', 'title', 'created_at', 'updated_at', 'messages')
+COMPRESSION_LEVEL = 1
+
+# Length arrays are written little-endian
+if array("I").itemsize != 4:
+    raise ImportError("compact_format needs a 4-byte unsigned int array type")
+_SWAP = sys.byteorder != "little"
+
+_u32 = struct.Struct("<I")
+_u64 = struct.Struct("<Q")
+
+
+def _pack_str(out, text):
+    data = text.encode()
+    out.append(_u32.pack(len(data)))
+    out.append(data)
+
+
+def _unpack_str(buf, pos):
+    (length,) = _u32.unpack_from(buf, pos)
+    pos += 4
+    return buf[pos:pos + length].decode(), pos + length
+
+
+def encode_conversation(username, conv):
+    out = []
+    _pack_str(out, username)
+    for field in ('id', 'title', 'created_at', 'updated_at'):
+        _pack_str(out, conv.get(field) or "")
+    # Any other keys ride along as JSON
+    extra = {k: v for k, v in conv.items() if k not in CONV_FIELDS}
+    _pack_str(out, json.dumps(extra) if extra else "")
+
+    messages = conv.get('messages')
+    if messages is None:
+        # Metadata-only record (messages kept in the append-only log)
+        out.append(b"\x00")
+    else:
+        # Messages are stored column-wise: role codes, text lengths (in
+        # characters) and one concatenated text blob
+        roles = [role for role, _ in messages]
+        texts = [text for _, text in messages]
+        other_roles = [role for role in roles if role not in ROLES]
+        out.append(b"\x01")
+        out.append(_u32.pack(len(messages)))
+        out.append(bytes(ROLES.get(role, OTHER_ROLE) for role in roles))
+        _pack_str(out, json.dumps(other_roles) if other_roles else "")
+        lengths = array("I", map(len, texts))
+        if _SWAP:
+            lengths.byteswap()
+        out.append(lengths.tobytes())
+        _pack_str(out, "".join(texts))
+    return zlib.compress(b"".join(out), COMPRESSION_LEVEL)
+
+
+def decode_conversation(frame):
+    buf = zlib.decompress(frame)
+    username, pos = _unpack_str(buf, 0)
+    conv = {}
+    for field in ('id', 'title', 'created_at', 'updated_at'):
+        conv[field], pos = _unpack_str(buf, pos)
+    extra, pos = _unpack_str(buf, pos)
+
+    if buf[pos]:
+        pos += 1
+        (count,) = _u32.unpack_from(buf, pos)
+        pos += 4
+        codes = buf[pos:pos + count]
+        pos += count
+        other_roles, pos = _unpack_str(buf, pos)
+        other_roles = iter(json.loads(other_roles)) if other_roles else iter(())
+        lengths = array("I")
+        lengths.frombytes(buf[pos:pos + 4 * count])
+        if _SWAP:
+            lengths.byteswap()
+        pos += 4 * count
+        blob, pos = _unpack_str(buf, pos)
+        ends = list(accumulate(lengths))
+        starts = [0] + ends[:-1]
+        conv['messages'] = [
+            [ROLE_NAMES[code] if code != OTHER_ROLE else next(other_roles), blob[start:end]]
+            for code, start, end in zip(codes, starts, ends)
+        ]
+    if extra:
+        conv.update(json.loads(extra))
+    return username, conv
+
+
+def _encode_index(entries):
+    out = [_u32.pack(len(entries))]
+    for username, conv_id, offset, length in entries:
+        _pack_str(out, username)
+        _pack_str(out, conv_id)
+        out.append(_u64.pack(offset))
+        out.append(_u32.pack(length))
+    return zlib.compress(b"".join(out))
+
+
+def _decode_index(data):
+    buf = zlib.decompress(data)
+    (count,) = _u32.unpack_from(buf, 0)
+    pos, entries = 4, []
+    for _ in range(count):
+        username, pos = _unpack_str(buf, pos)
+        conv_id, pos = _unpack_str(buf, pos)
+        (offset,) = _u64.unpack_from(buf, pos)
+        (length,) = _u32.unpack_from(buf, pos + 8)
+        pos += 12
+        entries.append((username, conv_id, offset, length))
+    return entries
+
+
+def dumps(data):
+    # data has the conversations-file shape: {username: [conv, ...]}
+    parts, entries, offset = [MAGIC], [], len(MAGIC)
+    for username, convs in data.items():
+        for conv in convs:
+            frame = encode_conversation(username, conv)
+            parts.append(_u32.pack(len(frame)))
+            parts.append(frame)
+            entries.append((username, conv['id'], offset + 4, len(frame)))
+            offset += 4 + len(frame)
+    parts.append(_encode_index(entries))
+    parts.append(_u64.pack(offset))
+    parts.append(MAGIC)
+    return b"".join(parts)
+
+
+def dump(data, path):
+    payload = dumps(data)
+    atomic_write(path, lambda f: f.write(payload), mode='wb')
+
+
+def iter_conversations(path):
+    # Streams (username, conv) pairs, holding one frame in memory at a time
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a compact conversation file")
+        f.seek(-(8 + len(MAGIC)), 2)
+        (index_offset,) = _u64.unpack(f.read(8))
+        f.seek(len(MAGIC))
+        while f.tell() < index_offset:
+            (length,) = _u32.unpack(f.read(4))
+            yield decode_conversation(f.read(length))
+
+
+def load(path):
+    data = {}
+    for username, conv in iter_conversations(path):
+        data.setdefault(username, []).append(conv)
+    return data
+
+
+def read_index(f):
+    f.seek(-(8 + len(MAGIC)), 2)
+    end = f.tell()
+    (index_offset,) = _u64.unpack(f.read(8))
+    f.seek(index_offset)
+    return _decode_index(f.read(end - index_offset))
+
+
+def read_conversation(path, username, conv_id):
+    try:
+        with open(path, 'rb') as f:
+            for entry_user, entry_id, offset, length in read_index(f):
+                if entry_user == username and entry_id == conv_id:
+                    f.seek(offset)
+                    return decode_conversation(f.read(length))[1]
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def json_to_compact(json_path, compact_path):
+    with open(json_path, 'r') as f:
+        dump(json.load(f), compact_path)
+
+
+def compact_to_json(compact_path, json_path, indent=2):
+    data = load(compact_path)
+    atomic_write(json_path, lambda f: json.dump(data, f, indent=indent))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert conversation stores between JSON and compact format")
+    parser.add_argument("direction", choices=["to-compact", "to-json"])
+    parser.add_argument("source")
+    parser.add_argument("target")
+    args = parser.parse_args()
+
+    if args.direction == "to-compact":
+        json_to_compact(args.source, args.target)
+    else:
+        compact_to_json(args.source, args.target)
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from file_store import atomic_write
+
+
+# Append-only per-conversation message log.
+# Each line is either one message `["role", "text"]` or a full snapshot
+# `{"snapshot": [[role, text], ...]}` that replaces everything before it.
+class ConversationLog:
+    def __init__(self, log_dir, compact_min=64):
+        self.log_dir = log_dir
+        self.compact_min = compact_min
+        os.makedirs(log_dir, exist_ok=True)
+        # Per-path size, message count and tail length, so appends skip replay
+        self._state = {}
+
+    def path(self, username, conv_id):
+        key = hashlib.sha1(f"{username}\0{conv_id}".encode()).hexdigest()
+        return os.path.join(self.log_dir, key + ".jsonl")
+
+    def lock_path(self, username):
+        # Writers lock per user rather than per log, so deleted and expired
+        # chats leave no lock file behind
+        return os.path.join(self.log_dir, hashlib.sha1(username.encode()).hexdigest() + ".user")
+
+    def replay(self, path):
+        # size is the bytes actually read, not the file size: a writer may
+        # append after EOF, and the next append must replay that too
+        messages, tail, base, torn, size = [], 0, 0, False, 0
+        try:
+            with open(path, 'rb') as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError
+                        record = json.loads(line)
+                    except ValueError:
+                        # Interrupted append; the next write compacts over it
+                        torn = True
+                        break
+                    if isinstance(record, dict):
+                        messages = record['snapshot']
+                        base, tail = len(messages), 0
+                    else:
+                        messages.append(record)
+                        tail += 1
+                    size += len(line)
+        except FileNotFoundError:
+            size = -1
+        self._state[path] = {
+            'size': size,
+            'count': len(messages),
+            'last': messages[-1] if messages else None,
+            'tail': tail,
+            'base': base,
+            'torn': torn
+        }
+        return messages
+
+    def updated_at(self, path):
+        return datetime.fromtimestamp(os.path.getmtime(path)).isoformat()
+
+    def append(self, path, messages):
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            size = -1
+        state = self._state.get(path)
+        if state is None or state['size'] != size:
+            self.replay(path)
+            state = self._state[path]
+        count = state['count']
+
+        # History was rewritten rather than extended: start over from a snapshot
+        if state['torn'] or count > len(messages) or (
+                count and state['last'] != list(messages[count - 1])):
+            self.compact(path, messages)
+            return
+
+        new = [list(m) for m in messages[count:]]
+        if not new:
+            os.utime(path)
+            return
+        # Fold the tail into a snapshot once it outgrows the snapshot, so the
+        # rewrite cost stays amortized constant per appended message
+        if state['tail'] + len(new) > max(state['base'], self.compact_min):
+            self.compact(path, messages)
+            return
+
+        with open(path, 'a') as f:
+            f.write("".join(json.dumps(m) + "\n" for m in new))
+            state['size'] = f.tell()
+        state['count'] += len(new)
+        state['last'] = new[-1]
+        state['tail'] += len(new)
+
+    def compact(self, path, messages):
+        messages = [list(m) for m in messages]
+        line = json.dumps({'snapshot': messages}) + "\n"
+        atomic_write(path, lambda f: f.write(line))
+        self._state[path] = {
+            'size': os.path.getsize(path),
+            'count': len(messages),
+            'last': messages[-1] if messages else None,
+            'tail': 0,
+            'base': len(messages),
+            'torn': False
+        }
+
+    def delete(self, path):
+        self._state.pop(path, None)
+        # The .lock is left over from per-log locking in earlier versions
+        for name in (path, path + ".lock"):
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,81 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+# Process-wide cache of parsed data files.
+# Entries are validated against the file's (mtime, size, inode) on every read,
+# so writes from other processes are picked up; writes made through this
+# process are stored directly with put(). Memory is bounded by the on-disk
+# size of the cached files, evicting least recently used entries first.
+class DataCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_entries=1024):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _signature(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def get(self, path, loader):
+        signature = self._signature(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        data = loader(path)
+        self._store(path, signature, data)
+        return data
+
+    def put(self, path, data):
+        self._store(path, self._signature(path), data)
+
+    def invalidate(self, path):
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None:
+                self._bytes -= entry[2]
+
+    def _store(self, path, signature, data):
+        # Missing files are not cached; the loader's empty default is cheap
+        if signature is None:
+            self.invalidate(path)
+            return
+        size = signature[1]
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self._bytes -= old[2]
+            if size > self.max_bytes:
+                return
+            self._entries[path] = (signature, data, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes
+            }
@@ -0,0 +1,898 @@
+import argparse
+import bisect
+import copy
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+import hashlib
+
+import auth
+import compact_format
+import tracing
+from chat_search import ChatSearchIndex
+from compact_format import COMPACT_SUFFIX
+from conversation_log import ConversationLog
+from data_cache import DataCache
+from file_store import atomic_write_json, locked
+
+DEFAULT_CONTEXT = {
+    'topics_discussed': [],
+    'preferences': {},
+    'interaction_count': 0,
+    'last_interaction': None
+}
+
+# Database simulation 
+class UserDatabase:
+    def __init__(self, log_dir=None, cache=None, shard_dir=None, compact=False,
+                 retention_days=7, search_dir=None, index_dir="conversation_index"):
+        self.users_file = "users_data.json"
+        # Conversations older than this are hidden and eventually archived
+        self.retention_days = retention_days
+        # Compact mode stores conversations in the binary format of compact_format
+        self.conversation_suffix = COMPACT_SUFFIX if compact else ".json"
+        self.conversations_file = "conversations_data" + self.conversation_suffix
+        self.context_file = "user_context.json"
+        # The conversation index is always one small file per user, since it
+        # is rewritten on every save
+        self.index_dir = index_dir
+        # With a shard dir, conversations and context get one file per user
+        # (same layout, a single key), so writers for different users never
+        # share a file or a lock
+        self.shard_dir = shard_dir
+        if shard_dir:
+            os.makedirs(os.path.join(shard_dir, "conversations"), exist_ok=True)
+            os.makedirs(os.path.join(shard_dir, "context"), exist_ok=True)
+            os.makedirs(os.path.join(shard_dir, "index"), exist_ok=True)
+        elif index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+        # With a log dir, messages go to append-only per-conversation logs and
+        # the conversations file only holds metadata
+        self.message_log = ConversationLog(log_dir) if log_dir else None
+        # Parsed files are shared through the cache, so callers must only
+        # mutate what they load when they save it straight back
+        self.cache = cache
+        # With a search dir, message text is also kept in per-user full-text
+        # indexes, updated on every save and delete
+        self.search_index = ChatSearchIndex(search_dir) if search_dir else None
+
+    def shard_path(self, kind, username, suffix=".json"):
+        key = hashlib.sha1(username.encode()).hexdigest()
+        return os.path.join(self.shard_dir, kind, key + suffix)
+
+    def conversations_path(self, username):
+        if self.shard_dir:
+            return self.shard_path("conversations", username, self.conversation_suffix)
+        return self.conversations_file
+
+    def context_path(self, username):
+        if self.shard_dir:
+            return self.shard_path("context", username)
+        return self.context_file
+
+    def index_path(self, username):
+        if self.shard_dir:
+            return self.shard_path("index", username)
+        return os.path.join(self.index_dir, hashlib.sha1(username.encode()).hexdigest() + ".json")
+
+    def data_files(self, kind):
+        # Every file holding conversations or context, for whole-store jobs
+        if self.shard_dir:
+            directory = os.path.join(self.shard_dir, kind)
+            return sorted(
+                os.path.join(directory, name) for name in os.listdir(directory)
+                if name.endswith((".json", COMPACT_SUFFIX))
+            )
+        return [self.conversations_file if kind == "conversations" else self.context_file]
+        
+    def retention_cutoff(self, now=None):
+        # ISO timestamps from datetime.isoformat() sort as strings
+        return ((now or datetime.now()) - timedelta(days=self.retention_days)).isoformat()
+
+    def read_file(self, filename):
+        try:
+            if filename.endswith(COMPACT_SUFFIX):
+                return compact_format.load(filename)
+            with open(filename, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def load_data(self, filename):
+        if self.cache is None:
+            return self.read_file(filename)
+        return self.cache.get(filename, self.read_file)
+    
+    def save_data(self, filename, data):
+        try:
+            if filename.endswith(COMPACT_SUFFIX):
+                compact_format.dump(data, filename)
+            else:
+                atomic_write_json(filename, data)
+        except BaseException:
+            if self.cache is not None:
+                self.cache.invalidate(filename)
+            raise
+        if self.cache is not None:
+            self.cache.put(filename, data)
+    
+    def hash_password(self, password):
+        return auth.run_in_pool(auth.hash_password, password)
+    
+    def verify_user(self, username, password):
+        users = self.load_data(self.users_file)
+        if username not in users:
+            auth.run_in_pool(auth.verify_password, auth.dummy_hash(), password)
+            return False
+        stored = users[username]['password']
+        matches, needs_rehash = auth.run_in_pool(auth.verify_password, stored, password)
+        # Upgrade legacy or outdated hashes while the password is at hand
+        if matches and needs_rehash:
+            self.set_password_hash(username, stored, self.hash_password(password))
+        return matches
+
+    def set_password_hash(self, username, old_hash, new_hash):
+        # Only replaces the hash it was derived from, so a concurrent change wins
+        with locked(self.users_file):
+            users = self.load_data(self.users_file)
+            if username in users and users[username]['password'] == old_hash:
+                users[username]['password'] = new_hash
+                self.save_data(self.users_file, users)
+
+    def session_epoch(self, username):
+        # Session tokens carrying an older epoch are revoked
+        return self.load_data(self.users_file).get(username, {}).get('session_epoch', 0)
+
+    def revoke_sessions(self, username):
+        with locked(self.users_file):
+            users = self.load_data(self.users_file)
+            if username in users:
+                users[username]['session_epoch'] = users[username].get('session_epoch', 0) + 1
+                self.save_data(self.users_file, users)
+    
+    def create_user(self, username, password):
+        if username in self.load_data(self.users_file):
+            return False
+        # Hash before taking the lock so the KDF never holds up other writers
+        password_hash = self.hash_password(password)
+        with locked(self.users_file):
+            users = self.load_data(self.users_file)
+            if username in users:
+                return False
+            users[username] = {
+                'password': password_hash,
+                'created_at': datetime.now().isoformat(),
+                'preferences': {
+                    'model': 'llama-3.3-70b-versatile',
+                    'temperature': 0.7,
+                    'theme': 'light'
+                }
+            }
+            self.save_data(self.users_file, users)
+        return True
+    
+    def get_user_conversations(self, username):
+        conversations = self.load_data(self.conversations_path(username))
+        user_convs = conversations.get(username, [])
+        # Conversations are appended as they are created, so the expired ones
+        # are a prefix of the list and can be skipped without scanning them
+        start = bisect.bisect_right(user_convs, self.retention_cutoff(), key=lambda c: c['created_at'])
+        filtered_convs = user_convs[start:]
+        if self.message_log:
+            filtered_convs = [dict(conv) for conv in filtered_convs]
+            for conv in filtered_convs:
+                path = self.message_log.path(username, conv['id'])
+                if os.path.exists(path):
+                    conv['messages'] = self.message_log.replay(path)
+                    conv['updated_at'] = self.message_log.updated_at(path)
+                else:
+                    conv.setdefault('messages', [])
+        return filtered_convs
+
+    def get_conversation(self, username, conv_id):
+        filename = self.conversations_path(username)
+        if filename.endswith(COMPACT_SUFFIX):
+            # Decode just this conversation's frame
+            conv = compact_format.read_conversation(filename, username, conv_id)
+        else:
+            conversations = self.load_data(filename)
+            conv = next((c for c in conversations.get(username, []) if c['id'] == conv_id), None)
+        if conv is None:
+            return None
+        conv = dict(conv)
+        if self.message_log:
+            path = self.message_log.path(username, conv_id)
+            if os.path.exists(path):
+                conv['messages'] = self.message_log.replay(path)
+                conv['updated_at'] = self.message_log.updated_at(path)
+            else:
+                conv.setdefault('messages', [])
+        return conv
+
+    def build_conversation_index(self, username):
+        entries = []
+        for conv in self.load_data(self.conversations_path(username)).get(username, []):
+            messages = conv.get('messages', [])
+            updated_at = conv.get('updated_at', conv['created_at'])
+            if self.message_log:
+                path = self.message_log.path(username, conv['id'])
+                if os.path.exists(path):
+                    messages = self.message_log.replay(path)
+                    updated_at = self.message_log.updated_at(path)
+            entries.append({
+                'id': conv['id'],
+                'title': conv['title'],
+                'created_at': conv['created_at'],
+                'updated_at': updated_at,
+                'message_count': len(messages)
+            })
+        entries.sort(key=lambda e: e['updated_at'])
+        return entries
+
+    def list_conversations(self, username, limit=20, offset=0):
+        # Metadata only, most recently updated first; no message bodies are read
+        index = self.load_data(self.index_path(username))
+        entries = index.get(username)
+        if entries is None:
+            entries = self.update_conversation_index(username)
+        cutoff = self.retention_cutoff()
+        recent = [e for e in reversed(entries) if e['created_at'] > cutoff]
+        return [dict(e) for e in recent[offset:offset + limit]]
+
+    def update_conversation_index(self, username, conv_id=None, message_count=0,
+                                  title="New Chat", created_at=None, delete=False):
+        # The index list is kept ordered by updated_at, oldest first
+        filename = self.index_path(username)
+        with locked(filename):
+            index = self.load_data(filename)
+            entries = index.get(username)
+            if entries is None:
+                entries = self.build_conversation_index(username)
+            elif conv_id is not None:
+                existing = next((e for e in entries if e['id'] == conv_id), None)
+                if existing:
+                    entries.remove(existing)
+                if not delete:
+                    now = datetime.now().isoformat()
+                    entries.append({
+                        'id': conv_id,
+                        'title': existing['title'] if existing else title,
+                        'created_at': existing['created_at'] if existing else created_at or now,
+                        'updated_at': now,
+                        'message_count': message_count
+                    })
+            index[username] = entries
+            self.save_data(filename, index)
+        return entries
+    
+    def save_conversation(self, username, conv_id, messages, title="New Chat"):
+        if self.message_log:
+            path = self.message_log.path(username, conv_id)
+            with locked(self.message_log.lock_path(username)):
+                known = os.path.exists(path)
+                self.message_log.append(path, messages)
+            # Metadata only needs writing the first time a conversation is logged
+            if known:
+                entries = self.update_conversation_index(username, conv_id, len(messages), title)
+                if self.search_index:
+                    # The caller's title is a placeholder; the index has the stored one
+                    entry = next(e for e in entries if e['id'] == conv_id)
+                    self.search_index.update(username, conv_id, messages, entry['title'], entry['created_at'])
+                return
+
+        filename = self.conversations_path(username)
+        with locked(filename):
+            conversations = self.load_data(filename)
+            if username not in conversations:
+                conversations[username] = []
+            
+            # Update existing or create new. The parsed file stays in the data
+            # cache, so it gets its own copy of the caller's live history
+            existing = next((c for c in conversations[username] if c['id'] == conv_id), None)
+            stored = [list(m) for m in messages]
+            if existing:
+                existing['messages'] = stored
+                existing['updated_at'] = datetime.now().isoformat()
+            else:
+                existing = {
+                    'id': conv_id,
+                    'title': title,
+                    'messages': stored,
+                    'created_at': datetime.now().isoformat(),
+                    'updated_at': datetime.now().isoformat()
+                }
+                conversations[username].append(existing)
+            if self.message_log:
+                existing.pop('messages')
+            
+            self.save_data(filename, conversations)
+        self.update_conversation_index(username, conv_id, len(messages), title, existing['created_at'])
+        if self.search_index:
+            self.search_index.update(username, conv_id, messages, existing['title'], existing['created_at'])
+    
+    def delete_conversation(self, username, conv_id):
+        if self.message_log:
+            path = self.message_log.path(username, conv_id)
+            with locked(self.message_log.lock_path(username)):
+                self.message_log.delete(path)
+        filename = self.conversations_path(username)
+        with locked(filename):
+            conversations = self.load_data(filename)
+            if username in conversations:
+                conversations[username] = [c for c in conversations[username] if c['id'] != conv_id]
+                self.save_data(filename, conversations)
+        self.update_conversation_index(username, conv_id, delete=True)
+        if self.search_index:
+            self.search_index.delete(username, [conv_id])
+
+    def search_conversations(self, username, query, limit=10):
+        # Ranked snippets from this user's chats; only the search index is read
+        if not self.search_index:
+            return []
+        return self.search_index.search(username, query, limit, cutoff=self.retention_cutoff())
+    
+    def drop_from_conversation_index(self, username, conv_ids):
+        filename = self.index_path(username)
+        with locked(filename):
+            index = self.load_data(filename)
+            if username in index:
+                index[username] = [e for e in index[username] if e['id'] not in conv_ids]
+                self.save_data(filename, index)
+
+    def expire_conversations(self, archive, now=None):
+        # Moves conversations created before the retention window out of the
+        # hot store. archive(username, conversations) must have persisted them
+        # before they are dropped here.
+        cutoff = self.retention_cutoff(now)
+        total = 0
+        for filename in self.data_files("conversations"):
+            expired_ids = {}
+            with locked(filename):
+                conversations = self.load_data(filename)
+                for username, user_convs in conversations.items():
+                    start = bisect.bisect_right(user_convs, cutoff, key=lambda c: c['created_at'])
+                    if not start:
+                        continue
+                    expired = [dict(c) for c in user_convs[:start]]
+                    if self.message_log:
+                        for conv in expired:
+                            path = self.message_log.path(username, conv['id'])
+                            if os.path.exists(path):
+                                conv['messages'] = self.message_log.replay(path)
+                    archive(username, expired)
+                    conversations[username] = user_convs[start:]
+                    expired_ids[username] = {c['id'] for c in expired}
+                if expired_ids:
+                    self.save_data(filename, conversations)
+
+            for username, conv_ids in expired_ids.items():
+                if self.message_log:
+                    with locked(self.message_log.lock_path(username)):
+                        for conv_id in conv_ids:
+                            self.message_log.delete(self.message_log.path(username, conv_id))
+                self.drop_from_conversation_index(username, conv_ids)
+                if self.search_index:
+                    self.search_index.delete(username, conv_ids)
+                total += len(conv_ids)
+        return total
+
+    def trim_contexts(self, now=None):
+        # Drops context topics older than the retention window
+        cutoff = self.retention_cutoff(now)
+        total = 0
+        for filename in self.data_files("context"):
+            with locked(filename):
+                context_data = self.load_data(filename)
+                trimmed = 0
+                for context in context_data.values():
+                    topics = context['topics_discussed']
+                    start = bisect.bisect_right(topics, cutoff, key=lambda t: t['timestamp'])
+                    if start:
+                        context['topics_discussed'] = topics[start:]
+                        trimmed += start
+                if trimmed:
+                    self.save_data(filename, context_data)
+                    total += trimmed
+        return total
+    
+    def get_user_context(self, username):
+        context_data = self.load_data(self.context_path(username))
+        return context_data.get(username, {
+            'topics_discussed': [],
+            'preferences': {},
+            'interaction_count': 0,
+            'last_interaction': None
+        })
+    
+    def update_user_context(self, username, message):
+        filename = self.context_path(username)
+        with locked(filename):
+            context_data = self.load_data(filename)
+            if username not in context_data:
+                context_data[username] = {
+                    'topics_discussed': [],
+                    'preferences': {},
+                    'interaction_count': 0,
+                    'last_interaction': None
+                }
+            
+            # Update context
+            context_data[username]['topics_discussed'].append({
+                'message': message[:100],
+                'timestamp': datetime.now().isoformat()
+            })
+            # Keep only last 50 topics
+            context_data[username]['topics_discussed'] = context_data[username]['topics_discussed'][-50:]
+            context_data[username]['interaction_count'] += 1
+            context_data[username]['last_interaction'] = datetime.now().isoformat()
+            
+            self.save_data(filename, context_data)
+
+# SQLite storage backend with the same method surface as UserDatabase
+class SQLiteUserDatabase(UserDatabase):
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        username TEXT PRIMARY KEY,
+        password TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        preferences TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS conversations (
+        username TEXT NOT NULL,
+        id TEXT NOT NULL,
+        title TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        PRIMARY KEY (username, id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_conversations_user_created
+        ON conversations (username, created_at);
+    CREATE INDEX IF NOT EXISTS idx_conversations_user_updated
+        ON conversations (username, updated_at);
+    CREATE TABLE IF NOT EXISTS messages (
+        username TEXT NOT NULL,
+        conv_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        PRIMARY KEY (username, conv_id, seq)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS contexts (
+        username TEXT PRIMARY KEY,
+        preferences TEXT NOT NULL,
+        interaction_count INTEGER NOT NULL,
+        last_interaction TEXT
+    );
+    CREATE TABLE IF NOT EXISTS topics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL,
+        message TEXT NOT NULL,
+        timestamp TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_topics_user ON topics (username, id);
+    CREATE TABLE IF NOT EXISTS sessions (
+        username TEXT PRIMARY KEY,
+        epoch INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_conversations_created ON conversations (created_at);
+    CREATE INDEX IF NOT EXISTS idx_topics_timestamp ON topics (timestamp);
+    """
+
+    def __init__(self, db_path="chatbot.db", retention_days=7, search_dir=None):
+        super().__init__(retention_days=retention_days, search_dir=search_dir, index_dir=None)
+        self.db_path = db_path
+        # Streamlit serves each session on its own thread
+        self._local = threading.local()
+        self.connection().executescript(self.SCHEMA)
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def verify_user(self, username, password):
+        row = self.connection().execute(
+            "SELECT password FROM users WHERE username = ?", (username,)
+        ).fetchone()
+        if row is None:
+            auth.run_in_pool(auth.verify_password, auth.dummy_hash(), password)
+            return False
+        matches, needs_rehash = auth.run_in_pool(auth.verify_password, row[0], password)
+        if matches and needs_rehash:
+            self.set_password_hash(username, row[0], self.hash_password(password))
+        return matches
+
+    def set_password_hash(self, username, old_hash, new_hash):
+        with self.connection() as conn:
+            conn.execute(
+                "UPDATE users SET password = ? WHERE username = ? AND password = ?",
+                (new_hash, username, old_hash)
+            )
+
+    def session_epoch(self, username):
+        row = self.connection().execute(
+            "SELECT epoch FROM sessions WHERE username = ?", (username,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def revoke_sessions(self, username):
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT INTO sessions (username, epoch) VALUES (?, 1) "
+                "ON CONFLICT (username) DO UPDATE SET epoch = epoch + 1",
+                (username,)
+            )
+
+    def create_user(self, username, password):
+        if self.connection().execute(
+            "SELECT 1 FROM users WHERE username = ?", (username,)
+        ).fetchone():
+            return False
+        preferences = {
+            'model': 'llama-3.3-70b-versatile',
+            'temperature': 0.7,
+            'theme': 'light'
+        }
+        with self.connection() as conn:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO users (username, password, created_at, preferences) "
+                "VALUES (?, ?, ?, ?)",
+                (username, self.hash_password(password), datetime.now().isoformat(),
+                 json.dumps(preferences))
+            )
+        return cur.rowcount == 1
+
+    def get_user_conversations(self, username):
+        conn = self.connection()
+        rows = conn.execute(
+            "SELECT id, title, created_at, updated_at FROM conversations "
+            "WHERE username = ? AND created_at > ? ORDER BY created_at",
+            (username, self.retention_cutoff())
+        ).fetchall()
+        conversations = []
+        for conv_id, title, created_at, updated_at in rows:
+            messages = conn.execute(
+                "SELECT role, content FROM messages WHERE username = ? AND conv_id = ? ORDER BY seq",
+                (username, conv_id)
+            ).fetchall()
+            conversations.append({
+                'id': conv_id,
+                'title': title,
+                'messages': [[role, content] for role, content in messages],
+                'created_at': created_at,
+                'updated_at': updated_at
+            })
+        return conversations
+
+    def get_conversation(self, username, conv_id):
+        conn = self.connection()
+        row = conn.execute(
+            "SELECT title, created_at, updated_at FROM conversations WHERE username = ? AND id = ?",
+            (username, conv_id)
+        ).fetchone()
+        if row is None:
+            return None
+        messages = conn.execute(
+            "SELECT role, content FROM messages WHERE username = ? AND conv_id = ? ORDER BY seq",
+            (username, conv_id)
+        ).fetchall()
+        return {
+            'id': conv_id,
+            'title': row[0],
+            'messages': [[role, content] for role, content in messages],
+            'created_at': row[1],
+            'updated_at': row[2]
+        }
+
+    def list_conversations(self, username, limit=20, offset=0):
+        rows = self.connection().execute(
+            "SELECT c.id, c.title, c.created_at, c.updated_at, "
+            "(SELECT COUNT(*) FROM messages m WHERE m.username = c.username AND m.conv_id = c.id) "
+            "FROM conversations c WHERE c.username = ? AND c.created_at > ? "
+            "ORDER BY c.updated_at DESC LIMIT ? OFFSET ?",
+            (username, self.retention_cutoff(), limit, offset)
+        ).fetchall()
+        return [
+            {'id': conv_id, 'title': title, 'created_at': created_at,
+             'updated_at': updated_at, 'message_count': count}
+            for conv_id, title, created_at, updated_at, count in rows
+        ]
+
+    def save_conversation(self, username, conv_id, messages, title="New Chat"):
+        now = datetime.now().isoformat()
+        with self.connection() as conn:
+            cur = conn.execute(
+                "UPDATE conversations SET updated_at = ? WHERE username = ? AND id = ?",
+                (now, username, conv_id)
+            )
+            if cur.rowcount == 0:
+                conn.execute(
+                    "INSERT INTO conversations (username, id, title, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (username, conv_id, title, now, now)
+                )
+            # The caller's title is a placeholder for a known chat; the search
+            # index gets the stored one
+            title, created_at = conn.execute(
+                "SELECT title, created_at FROM conversations WHERE username = ? AND id = ?",
+                (username, conv_id)
+            ).fetchone()
+
+            # Chat histories only grow, so normally just the new tail is written
+            stored = conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE username = ? AND conv_id = ?",
+                (username, conv_id)
+            ).fetchone()[0]
+            if stored:
+                last = conn.execute(
+                    "SELECT role, content FROM messages WHERE username = ? AND conv_id = ? AND seq = ?",
+                    (username, conv_id, stored - 1)
+                ).fetchone()
+                if stored > len(messages) or list(last) != list(messages[stored - 1]):
+                    conn.execute(
+                        "DELETE FROM messages WHERE username = ? AND conv_id = ?",
+                        (username, conv_id)
+                    )
+                    stored = 0
+            conn.executemany(
+                "INSERT INTO messages (username, conv_id, seq, role, content) VALUES (?, ?, ?, ?, ?)",
+                [(username, conv_id, seq, role, content)
+                 for seq, (role, content) in enumerate(messages[stored:], start=stored)]
+            )
+        if self.search_index:
+            self.search_index.update(username, conv_id, messages, title, created_at)
+
+    def delete_conversation(self, username, conv_id):
+        with self.connection() as conn:
+            conn.execute(
+                "DELETE FROM messages WHERE username = ? AND conv_id = ?", (username, conv_id)
+            )
+            conn.execute(
+                "DELETE FROM conversations WHERE username = ? AND id = ?", (username, conv_id)
+            )
+        if self.search_index:
+            self.search_index.delete(username, [conv_id])
+
+    def expire_conversations(self, archive, now=None):
+        cutoff = self.retention_cutoff(now)
+        rows = self.connection().execute(
+            "SELECT username, id FROM conversations WHERE created_at <= ? ORDER BY username, created_at",
+            (cutoff,)
+        ).fetchall()
+        by_user = {}
+        for username, conv_id in rows:
+            by_user.setdefault(username, []).append(conv_id)
+
+        for username, conv_ids in by_user.items():
+            archive(username, [self.get_conversation(username, conv_id) for conv_id in conv_ids])
+            keys = [(username, conv_id) for conv_id in conv_ids]
+            with self.connection() as conn:
+                conn.executemany("DELETE FROM messages WHERE username = ? AND conv_id = ?", keys)
+                conn.executemany("DELETE FROM conversations WHERE username = ? AND id = ?", keys)
+            # One search index rewrite per user rather than per conversation
+            if self.search_index:
+                self.search_index.delete(username, conv_ids)
+        return len(rows)
+
+    def trim_contexts(self, now=None):
+        with self.connection() as conn:
+            cur = conn.execute(
+                "DELETE FROM topics WHERE timestamp <= ?", (self.retention_cutoff(now),)
+            )
+        return cur.rowcount
+
+    def get_user_context(self, username):
+        conn = self.connection()
+        row = conn.execute(
+            "SELECT preferences, interaction_count, last_interaction FROM contexts WHERE username = ?",
+            (username,)
+        ).fetchone()
+        if row is None:
+            return copy.deepcopy(DEFAULT_CONTEXT)
+        topics = conn.execute(
+            "SELECT message, timestamp FROM topics WHERE username = ? ORDER BY id",
+            (username,)
+        ).fetchall()
+        return {
+            'topics_discussed': [{'message': m, 'timestamp': ts} for m, ts in topics],
+            'preferences': json.loads(row[0]),
+            'interaction_count': row[1],
+            'last_interaction': row[2]
+        }
+
+    def update_user_context(self, username, message):
+        now = datetime.now().isoformat()
+        with self.connection() as conn:
+            conn.execute(
+                "INSERT INTO contexts (username, preferences, interaction_count, last_interaction) "
+                "VALUES (?, '{}', 1, ?) "
+                "ON CONFLICT (username) DO UPDATE SET "
+                "interaction_count = interaction_count + 1, last_interaction = excluded.last_interaction",
+                (username, now)
+            )
+            conn.execute(
+                "INSERT INTO topics (username, message, timestamp) VALUES (?, ?, ?)",
+                (username, message[:100], now)
+            )
+            # Keep only last 50 topics
+            conn.execute(
+                "DELETE FROM topics WHERE username = ? AND id NOT IN "
+                "(SELECT id FROM topics WHERE username = ? ORDER BY id DESC LIMIT 50)",
+                (username, username)
+            )
+
+
+def migrate_json_to_sqlite(db_path="chatbot.db", users_file="users_data.json",
+                           conversations_file="conversations_data.json",
+                           context_file="user_context.json", log_dir=None, shard_dir=None):
+    # One-shot import of the JSON stores; rows that already exist are left alone
+    source = UserDatabase(log_dir=log_dir, shard_dir=shard_dir)
+    source.users_file = users_file
+    source.conversations_file = conversations_file
+    source.context_file = context_file
+    target = SQLiteUserDatabase(db_path)
+    users = source.load_data(users_file)
+    conversations, context_data = {}, {}
+    for filename in source.data_files("conversations"):
+        conversations.update(source.load_data(filename))
+    for filename in source.data_files("context"):
+        context_data.update(source.load_data(filename))
+    counts = {'users': 0, 'conversations': 0, 'messages': 0, 'contexts': 0}
+
+    with target.connection() as conn:
+        for username, user in users.items():
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO users (username, password, created_at, preferences) "
+                "VALUES (?, ?, ?, ?)",
+                (username, user['password'], user.get('created_at', datetime.now().isoformat()),
+                 json.dumps(user.get('preferences', {})))
+            )
+            counts['users'] += cur.rowcount
+            # Carried over so tokens revoked by a logout stay revoked
+            if user.get('session_epoch'):
+                conn.execute(
+                    "INSERT INTO sessions (username, epoch) VALUES (?, ?) "
+                    "ON CONFLICT (username) DO UPDATE SET epoch = MAX(epoch, excluded.epoch)",
+                    (username, user['session_epoch'])
+                )
+
+        for username, user_convs in conversations.items():
+            for conv in user_convs:
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO conversations (username, id, title, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (username, conv['id'], conv.get('title', 'New Chat'), conv['created_at'],
+                     conv.get('updated_at', conv['created_at']))
+                )
+                if cur.rowcount == 0:
+                    continue
+                counts['conversations'] += 1
+                messages = conv.get('messages', [])
+                if source.message_log:
+                    path = source.message_log.path(username, conv['id'])
+                    if os.path.exists(path):
+                        messages = source.message_log.replay(path)
+                conn.executemany(
+                    "INSERT INTO messages (username, conv_id, seq, role, content) VALUES (?, ?, ?, ?, ?)",
+                    [(username, conv['id'], seq, role, content)
+                     for seq, (role, content) in enumerate(messages)]
+                )
+                counts['messages'] += len(messages)
+
+        for username, context in context_data.items():
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO contexts (username, preferences, interaction_count, last_interaction) "
+                "VALUES (?, ?, ?, ?)",
+                (username, json.dumps(context.get('preferences', {})),
+                 context.get('interaction_count', 0), context.get('last_interaction'))
+            )
+            if cur.rowcount == 0:
+                continue
+            counts['contexts'] += 1
+            conn.executemany(
+                "INSERT INTO topics (username, message, timestamp) VALUES (?, ?, ?)",
+                [(username, t['message'], t['timestamp'])
+                 for t in context.get('topics_discussed', [])]
+            )
+
+    return counts
+
+
+def shard_json_stores(shard_dir, conversations_file="conversations_data.json",
+                      context_file="user_context.json"):
+    # Split the single-file stores into per-user shards; users that already
+    # have a shard keep it
+    db = UserDatabase(shard_dir=shard_dir)
+    counts = {'conversations': 0, 'context': 0}
+    for kind, filename, path_for in (
+        ('conversations', conversations_file, db.conversations_path),
+        ('context', context_file, db.context_path),
+    ):
+        for username, value in db.load_data(filename).items():
+            path = path_for(username)
+            with locked(path):
+                if os.path.exists(path):
+                    continue
+                db.save_data(path, {username: value})
+            counts[kind] += 1
+    return counts
+
+
+def index_chat_history(db):
+    # Backfills the search index from the stored conversations; messages that
+    # are already indexed are skipped
+    if isinstance(db, SQLiteUserDatabase):
+        usernames = [row[0] for row in db.connection().execute("SELECT username FROM users")]
+    else:
+        usernames = list(db.load_data(db.users_file))
+    counts = {'users': 0, 'conversations': 0}
+    for username in usernames:
+        conversations = db.get_user_conversations(username)
+        for conv in conversations:
+            db.search_index.update(username, conv['id'], conv['messages'], conv['title'], conv['created_at'])
+        counts['users'] += 1
+        counts['conversations'] += len(conversations)
+    return counts
+
+
+# Timing spans on the storage hot path; a no-op unless TRACING is on
+TRACED_METHODS = (
+    "load_data", "save_data", "verify_user", "create_user", "get_user_conversations",
+    "get_conversation", "list_conversations", "save_conversation", "delete_conversation",
+    "search_conversations", "get_user_context", "update_user_context"
+)
+tracing.instrument(UserDatabase, TRACED_METHODS, "db.")
+tracing.instrument(SQLiteUserDatabase, TRACED_METHODS, "db.")
+
+
+def create_database():
+    # DB_BACKEND=sqlite switches storage to DB_PATH; JSON files stay the default
+    # CONVERSATION_LOG_DIR turns on append-only message logs for the JSON backend
+    # DATA_SHARD_DIR stores conversations and context in per-user files
+    # STORAGE_FORMAT=compact writes conversations in the binary compact format
+    # RETENTION_DAYS sets how long conversations stay in the hot store
+    # CHAT_SEARCH_DIR holds the chat history search indexes; empty turns search off
+    backend = os.getenv("DB_BACKEND", "json").lower()
+    retention_days = int(os.getenv("RETENTION_DAYS", "7"))
+    search_dir = os.getenv("CHAT_SEARCH_DIR", "chat_search") or None
+    if backend == "sqlite":
+        return SQLiteUserDatabase(os.getenv("DB_PATH", "chatbot.db"), retention_days=retention_days,
+                                  search_dir=search_dir)
+    cache = DataCache(max_bytes=int(os.getenv("DATA_CACHE_MB", "64")) * 1024 * 1024)
+    return UserDatabase(
+        log_dir=os.getenv("CONVERSATION_LOG_DIR") or None,
+        cache=cache,
+        shard_dir=os.getenv("DATA_SHARD_DIR") or None,
+        compact=os.getenv("STORAGE_FORMAT", "json").lower() == "compact",
+        retention_days=retention_days,
+        search_dir=search_dir
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Storage maintenance for Iyyappan AI")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="Import the JSON stores into SQLite")
+    migrate.add_argument("--db", default=os.getenv("DB_PATH", "chatbot.db"))
+    migrate.add_argument("--log-dir", default=os.getenv("CONVERSATION_LOG_DIR") or None)
+    migrate.add_argument("--shard-dir", default=os.getenv("DATA_SHARD_DIR") or None)
+    shard = sub.add_parser("shard", help="Split the JSON stores into per-user files")
+    shard.add_argument("--shard-dir", default=os.getenv("DATA_SHARD_DIR") or "data")
+    sub.add_parser("index-search", help="Add stored chats to the chat search index")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        print(migrate_json_to_sqlite(args.db, log_dir=args.log_dir, shard_dir=args.shard_dir))
+    elif args.command == "shard":
+        print(shard_json_stores(args.shard_dir))
+    elif args.command == "index-search":
+        db = create_database()
+        if db.search_index is None:
+            parser.error("CHAT_SEARCH_DIR is empty, so chat search is off")
+        print(index_chat_history(db))
@@ -0,0 +1,96 @@
+import hashlib
+import os
+import random
+import threading
+import time
+
+import groq
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+WORDS = ("the a model reply answer token stream latency cache memory context user chat "
+         "python data index query result value system request response simple example "
+         "because therefore however first second finally also with from into about").split()
+
+_counter_lock = threading.Lock()
+
+
+def _fake_request():
+    return httpx.Request("POST", "http://fake-llm/openai/v1/chat/completions")
+
+
+def injected_error(kind):
+    if kind == "timeout":
+        return groq.APITimeoutError(request=_fake_request())
+    if kind == "server":
+        response = httpx.Response(503, request=_fake_request())
+        return groq.InternalServerError("fake overload", response=response, body=None)
+    response = httpx.Response(429, request=_fake_request(), headers={"retry-after": "0"})
+    return groq.RateLimitError("fake rate limit", response=response, body=None)
+
+
+# Offline stand-in for ChatGroq with a configurable first-token latency,
+# generation speed and error rate. Replies are made-up words seeded from the
+# prompt, so the same prompt always gets the same reply.
+class FakeChatModel(BaseChatModel):
+    model_name: str = "fake"
+    temperature: float = 0.7
+    latency: float = 0.2
+    tokens_per_second: float = 200.0
+    reply_words: int = 60
+    error_rate: float = 0.0
+    error_kind: str = "rate_limit"
+    calls: int = 0
+    errors: int = 0
+
+    @classmethod
+    def from_env(cls, model_name, temperature):
+        return cls(
+            model_name=model_name,
+            temperature=temperature,
+            latency=float(os.getenv("FAKE_LLM_LATENCY_SECONDS", "0.2")),
+            tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "200")),
+            reply_words=int(os.getenv("FAKE_LLM_REPLY_WORDS", "60")),
+            error_rate=float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+            error_kind=os.getenv("FAKE_LLM_ERROR_KIND", "rate_limit")
+        )
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _start(self, messages):
+        with _counter_lock:
+            self.calls += 1
+            failed = random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        time.sleep(self.latency)
+        if failed:
+            raise injected_error(self.error_kind)
+        prompt = messages[-1].content if messages else ""
+        seed = hashlib.blake2b(f"{self.model_name}:{prompt}".encode(), digest_size=8).digest()
+        rng = random.Random(seed)
+        return [rng.choice(WORDS) for _ in range(self.reply_words)]
+
+    def _usage(self, messages, words):
+        prompt_tokens = sum(len(str(m.content)) for m in messages) // 4 + 1
+        return {'input_tokens': prompt_tokens, 'output_tokens': len(words),
+                'total_tokens': prompt_tokens + len(words)}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        words = self._start(messages)
+        if self.tokens_per_second:
+            time.sleep(len(words) / self.tokens_per_second)
+        message = AIMessage(content=" ".join(words), usage_metadata=self._usage(messages, words))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        words = self._start(messages)
+        for i, word in enumerate(words):
+            if self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, words)))
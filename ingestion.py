@@ -0,0 +1,240 @@
+import codecs
+import hashlib
+import logging
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree.ElementTree import iterparse
+
+logger = logging.getLogger(__name__)
+
+READ_BLOCK = 64 * 1024
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def content_hash(stream):
+    # Hashes in blocks so large uploads are never copied whole
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for block in iter(lambda: stream.read(READ_BLOCK), b""):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+# Page extractors: each yields (page_number, text) one page at a time
+
+def iter_text_pages(stream):
+    # Plain text has no pages; form feeds split it, otherwise one 64 KB block
+    # is decoded at a time
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    page, carry = 1, ""
+    for block in iter(lambda: stream.read(READ_BLOCK), b""):
+        parts = (carry + decoder.decode(block)).split("\f")
+        for part in parts[:-1]:
+            yield page, part
+            page += 1
+        carry = parts[-1]
+        if len(carry) >= READ_BLOCK:
+            yield page, carry
+            carry = ""
+    carry += decoder.decode(b"", final=True)
+    if carry:
+        yield page, carry
+
+
+def iter_pdf_pages(stream):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise RuntimeError("PDF uploads need the optional pypdf package")
+    for number, page in enumerate(PdfReader(stream).pages, 1):
+        yield number, page.extract_text() or ""
+
+
+def iter_docx_pages(stream):
+    # Streams word/document.xml; rendered and explicit page breaks end a page
+    page, paragraphs = 1, []
+    with zipfile.ZipFile(stream) as archive, archive.open("word/document.xml") as xml:
+        for event, element in iterparse(xml, events=("start", "end")):
+            if event == "start":
+                if element.tag == _W + "lastRenderedPageBreak" or (
+                        element.tag == _W + "br" and element.get(_W + "type") == "page"):
+                    if paragraphs:
+                        yield page, "\n".join(paragraphs)
+                        paragraphs = []
+                    page += 1
+                continue
+            if element.tag == _W + "p":
+                text = "".join(t.text or "" for t in element.iter(_W + "t"))
+                if text:
+                    paragraphs.append(text)
+                element.clear()
+    if paragraphs:
+        yield page, "\n".join(paragraphs)
+
+
+def iter_image_pages(stream):
+    try:
+        import pytesseract
+        from PIL import Image
+    except ImportError:
+        raise RuntimeError("image uploads need the optional pytesseract package for OCR")
+    yield 1, pytesseract.image_to_string(Image.open(stream))
+
+
+EXTRACTORS = {
+    ".txt": iter_text_pages,
+    ".pdf": iter_pdf_pages,
+    ".docx": iter_docx_pages,
+    ".jpg": iter_image_pages,
+    ".jpeg": iter_image_pages,
+    ".png": iter_image_pages
+}
+
+
+def iter_chunks(pages, chunk_chars=1500, overlap=200):
+    # Packs page text into ~chunk_chars pieces, breaking on whitespace, with
+    # `overlap` characters carried into the next chunk. Only the unfinished
+    # tail is held between pages. A cut never falls before chunk_chars // 2,
+    # so the overlap is kept below that for every chunk to move forward.
+    overlap = min(overlap, chunk_chars // 4)
+    buffer, buffer_page, index = "", None, 0
+    for page, text in pages:
+        if buffer_page is None:
+            buffer_page = page
+        buffer += text if not buffer else "\n" + text
+        while len(buffer) >= chunk_chars:
+            cut = buffer.rfind(" ", chunk_chars // 2, chunk_chars)
+            cut = cut if cut > 0 else chunk_chars
+            yield {'index': index, 'page': buffer_page, 'text': buffer[:cut].strip()}
+            index += 1
+            buffer = buffer[max(cut - overlap, 0):]
+            buffer_page = page
+    if buffer.strip():
+        yield {'index': index, 'page': buffer_page, 'text': buffer.strip()}
+
+
+class IngestJob:
+    def __init__(self, name, digest):
+        self.name = name
+        self.digest = digest
+        self.chunks = []
+        self.chunk_count = 0
+        self.size = 0
+        self.pages = 0
+        self.error = None
+        self.done = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def status(self):
+        if not self.done.is_set():
+            return "processing"
+        return "failed" if self.error else "ready"
+
+    def add_done_callback(self, fn):
+        # fn(job) runs once the job finishes, on the worker thread, or right
+        # away if it already has
+        with self._lock:
+            if not self.done.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def _finish(self):
+        with self._lock:
+            self.done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception as exc:
+                logger.warning("callback for %s failed: %s", self.name, exc)
+
+
+# Extracts and chunks uploads on a small worker pool. Jobs are keyed by the
+# content hash: the same bytes uploaded again, by anyone, get the finished
+# (or still running) job back without any new work. Finished jobs keep their
+# chunks for later uploads of the same file until they are evicted, oldest
+# first, past max_jobs or max_bytes of chunk text.
+class Ingestor:
+    def __init__(self, workers=2, max_jobs=256, max_bytes=64 << 20, chunk_chars=1500, overlap=200):
+        self.chunk_chars = chunk_chars
+        self.overlap = overlap
+        self.max_jobs = max_jobs
+        self.max_bytes = max_bytes
+        self._bytes = 0
+        self._sizes = {}
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        with self._lock:
+            job = self._jobs.get(digest)
+            if job is not None:
+                self._jobs.move_to_end(digest)
+            return job
+
+    def submit(self, name, data, digest=None):
+        # data is a seekable binary stream; the worker reads it, so it must
+        # not be closed or reused until the job is done
+        digest = digest or content_hash(data)
+        with self._lock:
+            job = self._jobs.get(digest)
+            if job is not None:
+                self._jobs.move_to_end(digest)
+                return job
+            job = self._jobs[digest] = IngestJob(name, digest)
+            self._trim()
+        self._pool.submit(self._run, job, data)
+        return job
+
+    def _trim(self):
+        # Caller holds self._lock; the most recently used job always stays
+        while len(self._jobs) > 1 and (len(self._jobs) > self.max_jobs or self._bytes > self.max_bytes):
+            digest, job = self._jobs.popitem(last=False)
+            self._bytes -= self._sizes.pop(digest, 0)
+            if job.done.is_set():
+                job.chunks = []
+
+    def _cache(self, job):
+        # Counts a finished job's chunks against max_bytes, or drops them if
+        # it was evicted (or failed) while running
+        with self._lock:
+            if self._jobs.get(job.digest) is not job:
+                job.chunks = []
+                return
+            self._sizes[job.digest] = job.size
+            self._bytes += job.size
+            self._trim()
+
+    def _run(self, job, data):
+        try:
+            extract = EXTRACTORS.get(os.path.splitext(job.name)[1].lower())
+            if extract is None:
+                raise RuntimeError(f"unsupported file type: {job.name}")
+            data.seek(0)
+
+            def counted(pages):
+                for page, text in pages:
+                    job.pages = page
+                    yield page, text
+            for chunk in iter_chunks(counted(extract(data)), self.chunk_chars, self.overlap):
+                job.chunks.append(chunk)
+                job.chunk_count += 1
+                job.size += len(chunk['text'])
+        except Exception as exc:
+            logger.warning("ingesting %s failed: %s", job.name, exc)
+            job.error = str(exc)
+            # Failed jobs are not cached, so a fixed environment can retry
+            with self._lock:
+                if self._jobs.get(job.digest) is job:
+                    del self._jobs[job.digest]
+        finally:
+            job._finish()
+        self._cache(job)
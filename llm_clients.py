@@ -0,0 +1,71 @@
+import os
+import threading
+
+import groq
+import httpx
+from langchain_groq import ChatGroq
+
+from fake_llm import FakeChatModel
+
+# One ChatGroq per (model, temperature) for the whole process, all sharing a
+# single keep-alive HTTP connection pool. Sessions build their own chains
+# (and memory) on top of these shared clients.
+_clients = {}
+_lock = threading.Lock()
+_http_client = None
+
+# Failures of a model call (HTTP status, auth, connection, timeout) that are
+# reported to the user rather than raised
+LLM_ERRORS = (groq.APIError, httpx.HTTPError)
+
+
+def get_http_client():
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+                    max_keepalive_connections=int(os.getenv("LLM_KEEPALIVE_CONNECTIONS", "10")),
+                    keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_SECONDS", "60"))
+                ),
+                timeout=httpx.Timeout(float(os.getenv("LLM_TIMEOUT_SECONDS", "60")), connect=10.0)
+            )
+        return _http_client
+
+
+def get_llm(model_name, temperature=0.7):
+    key = (model_name, round(float(temperature), 2))
+    llm = _clients.get(key)
+    if llm is not None:
+        return llm
+    http_client = get_http_client()
+    with _lock:
+        llm = _clients.get(key)
+        if llm is None:
+            if os.getenv("LLM_BACKEND", "groq").lower() == "fake":
+                # Offline model for load tests; no Groq quota is used
+                llm = FakeChatModel.from_env(model_name, key[1])
+            else:
+                llm = ChatGroq(
+                    groq_api_key=os.getenv("GROQ_API_KEY"),
+                    model_name=model_name,
+                    temperature=key[1],
+                    http_client=http_client,
+                    # Retries belong to the scheduler, which also budgets them
+                    max_retries=0,
+                    # GROQ_API_BASE points the clients at a proxy or local stand-in
+                    base_url=os.getenv("GROQ_API_BASE") or None
+                )
+            _clients[key] = llm
+        return llm
+
+
+def reset_clients():
+    # Drops cached clients and closes the pool (tests and benchmarks)
+    global _http_client
+    with _lock:
+        _clients.clear()
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
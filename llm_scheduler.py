@@ -0,0 +1,188 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class SchedulerBusy(Exception):
+    pass
+
+
+def status_code(exc):
+    # groq.APIStatusError and httpx.HTTPStatusError both carry the response
+    code = getattr(exc, 'status_code', None)
+    if code is None and getattr(exc, 'response', None) is not None:
+        code = getattr(exc.response, 'status_code', None)
+    return code
+
+
+def retry_after(exc):
+    response = getattr(exc, 'response', None)
+    try:
+        return float(response.headers.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+# Refills continuously at rate_per_minute and holds up to burst_seconds worth
+# of refill. A rate of 0 means unlimited.
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst_seconds=60.0, clock=time.monotonic):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.clock = clock
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount):
+        # Takes `amount` now and returns how long the caller must wait before
+        # using it; waiting callers queue up behind each other in order
+        if not self.rate:
+            return 0.0
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            now = self.clock()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            self.level -= amount
+            return -self.level / self.rate if self.level < 0 else 0.0
+
+
+# Process-wide gate in front of every LLM call: a global requests/min and
+# tokens/min budget, a cap on concurrent calls per user, and retries with
+# jittered exponential backoff on 429 and 5xx responses.
+class RequestScheduler:
+    def __init__(self, requests_per_minute=30, tokens_per_minute=0, per_user_limit=2,
+                 max_retries=3, backoff_seconds=1.0, max_backoff_seconds=20.0,
+                 queue_timeout=60.0, burst_seconds=60.0, sleep=time.sleep, rng=None):
+        self.requests = TokenBucket(requests_per_minute, burst_seconds)
+        self.tokens = TokenBucket(tokens_per_minute, burst_seconds)
+        self.per_user_limit = per_user_limit
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.queue_timeout = queue_timeout
+        self.sleep = sleep
+        self.rng = rng or random.Random()
+        self._user_slots = {}
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.peak_queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.throttled_seconds = 0.0
+
+    def _slot(self, user):
+        with self._lock:
+            slot = self._user_slots.get(user)
+            if slot is None:
+                slot = self._user_slots[user] = threading.BoundedSemaphore(self.per_user_limit)
+            return slot
+
+    def _count(self, name, delta):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + delta)
+            if name == 'queued':
+                self.peak_queued = max(self.peak_queued, self.queued)
+
+    @contextmanager
+    def _admit(self, user):
+        slot = self._slot(user)
+        if not slot.acquire(blocking=False):
+            self._count('queued', 1)
+            try:
+                if not slot.acquire(timeout=self.queue_timeout):
+                    raise SchedulerBusy(f"{user} already has {self.per_user_limit} requests in flight")
+            finally:
+                self._count('queued', -1)
+        try:
+            yield
+        finally:
+            slot.release()
+
+    def _throttle(self, tokens):
+        wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        if wait > 0:
+            self._count('queued', 1)
+            self._count('throttled_seconds', wait)
+            try:
+                self.sleep(wait)
+            finally:
+                self._count('queued', -1)
+
+    def _retry_delay(self, exc, attempt):
+        code = status_code(exc)
+        if code not in RETRY_STATUSES or attempt >= self.max_retries:
+            return None
+        # Full jitter over an exponential cap; a Retry-After header is a floor
+        cap = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** attempt)
+        delay = max(self.rng.uniform(0, cap), retry_after(exc) or 0.0)
+        logger.warning("LLM call failed with %s, retry %d in %.2fs", code, attempt + 1, delay)
+        self._count('retries', 1)
+        return delay
+
+    def run(self, user, call, tokens=1):
+        with self._admit(user):
+            attempt = 0
+            while True:
+                self._throttle(tokens)
+                self._count('in_flight', 1)
+                try:
+                    result = call()
+                except Exception as exc:
+                    delay = self._retry_delay(exc, attempt)
+                    if delay is None:
+                        self._count('failed', 1)
+                        raise
+                else:
+                    self._count('completed', 1)
+                    return result
+                finally:
+                    self._count('in_flight', -1)
+                attempt += 1
+                self.sleep(delay)
+
+    def stream(self, user, make_stream, tokens=1):
+        # Like run() for an iterator; only retried before the first item
+        with self._admit(user):
+            attempt = 0
+            while True:
+                self._throttle(tokens)
+                self._count('in_flight', 1)
+                started = False
+                try:
+                    for item in make_stream():
+                        started = True
+                        yield item
+                except Exception as exc:
+                    delay = None if started else self._retry_delay(exc, attempt)
+                    if delay is None:
+                        self._count('failed', 1)
+                        raise
+                else:
+                    self._count('completed', 1)
+                    return
+                finally:
+                    self._count('in_flight', -1)
+                attempt += 1
+                self.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self.queued,
+                'peak_queued': self.peak_queued,
+                'in_flight': self.in_flight,
+                'completed': self.completed,
+                'failed': self.failed,
+                'retries': self.retries,
+                'throttled_seconds': self.throttled_seconds
+            }
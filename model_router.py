@@ -0,0 +1,111 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+_CODE = re.compile(
+    r"```|\b(def|class|import|return|lambda|function|const|select|traceback|exception|stack trace)\b|[{};]\s*$",
+    re.IGNORECASE | re.MULTILINE
+)
+_MATH = re.compile(
+    r"\d\s*[-+*/^=<>]\s*\d|\\frac|\\int|\\sum|"
+    r"\b(integral|derivative|equation|prove|proof|theorem|matrix|probability|solve)\b",
+    re.IGNORECASE
+)
+_REASONING = re.compile(
+    r"\b(why|compare|contrast|analy[sz]e|design|optimi[sz]e|trade-?offs?|step by step|in detail|pros and cons)\b",
+    re.IGNORECASE
+)
+
+
+def is_fallback_error(exc):
+    # Errors that mean "try another model", not "the request is wrong". The
+    # clients that raise them are loaded by then; the router itself stays
+    # cheap to import for the signed-in sidebar.
+    import groq
+    import httpx
+    return isinstance(exc, (groq.RateLimitError, groq.APITimeoutError, httpx.TimeoutException))
+
+
+def prompt_features(prompt, depth=0):
+    return {
+        'words': len(prompt.split()),
+        'code': bool(_CODE.search(prompt)),
+        'math': bool(_MATH.search(prompt)),
+        'reasoning': bool(_REASONING.search(prompt)),
+        'depth': depth
+    }
+
+
+def complexity_score(features):
+    score = 0
+    if features['words'] > 40:
+        score += 1
+    if features['words'] > 150:
+        score += 1
+    if features['code']:
+        score += 2
+    if features['math']:
+        score += 2
+    if features['reasoning']:
+        score += 1
+    # Long conversations need the larger model to keep track of context
+    if features['depth'] >= 10:
+        score += 1
+    return score
+
+
+# Picks a model per turn from a cheap local score and keeps per-model latency
+# so the threshold can be tuned from real traffic. With log_path set, every
+# call is appended as a JSON line with its features, model and latency.
+class ModelRouter:
+    def __init__(self, simple_model, hard_model, models, threshold=2, window=500, log_path=None):
+        self.simple_model = simple_model
+        self.hard_model = hard_model
+        self.models = list(models)
+        self.threshold = threshold
+        self.window = window
+        self.log_path = log_path
+        self._latencies = {}
+        self._calls = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def route(self, prompt, depth=0):
+        features = prompt_features(prompt, depth)
+        features['score'] = complexity_score(features)
+        model = self.hard_model if features['score'] >= self.threshold else self.simple_model
+        return model, features
+
+    def fallbacks(self, model):
+        return [model] + [m for m in self.models if m != model]
+
+    def record(self, model, seconds, ok=True, features=None):
+        with self._lock:
+            if ok:
+                self._latencies.setdefault(model, deque(maxlen=self.window)).append(seconds)
+            else:
+                self._errors[model] = self._errors.get(model, 0) + 1
+            self._calls[model] = self._calls.get(model, 0) + 1
+            if self.log_path:
+                entry = {'time': time.time(), 'model': model, 'seconds': round(seconds, 4), 'ok': ok}
+                entry.update(features or {})
+                with open(self.log_path, 'a') as f:
+                    f.write(json.dumps(entry) + "\n")
+
+    def stats(self):
+        with self._lock:
+            result = {}
+            for model, calls in self._calls.items():
+                latencies = sorted(self._latencies.get(model, ()))
+                result[model] = {
+                    'calls': calls,
+                    'errors': self._errors.get(model, 0),
+                    'p50': latencies[len(latencies) // 2] if latencies else None,
+                    'p95': latencies[int(len(latencies) * 0.95)] if latencies else None
+                }
+            return result
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.,;:]+$")
+_QUOTES = str.maketrans({"‘": "'", "’": "'", "“": '"', "”": '"'})
+
+
+def collapse_whitespace(text):
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def strip_trailing_punctuation(text):
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+
+def unify_quotes(text):
+    return text.translate(_QUOTES)
+
+
+DEFAULT_NORMALIZERS = (str.lower, unify_quotes, collapse_whitespace, strip_trailing_punctuation)
+
+
+def normalize_prompt(text, normalizers=DEFAULT_NORMALIZERS):
+    for normalize in normalizers:
+        text = normalize(text)
+    return text
+
+
+# Canned answers for known intents, matched on the normalized prompt
+class FastPathRegistry:
+    def __init__(self, normalizers=DEFAULT_NORMALIZERS):
+        self.normalizers = normalizers
+        self._responses = {}
+        self.hits = 0
+        self.misses = 0
+
+    def register(self, phrases, response):
+        for phrase in phrases:
+            self._responses[normalize_prompt(phrase, self.normalizers)] = response
+
+    def load_file(self, path):
+        # {"intents": [{"phrases": ["..."], "response": "..."}]}
+        with open(path, 'r') as f:
+            for intent in json.load(f).get('intents', []):
+                self.register(intent['phrases'], intent['response'])
+
+    def match(self, text):
+        response = self._responses.get(normalize_prompt(text, self.normalizers))
+        if response is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return response
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self._responses)
+        }
+
+
+# Thread-safe LRU cache whose entries also expire after ttl_seconds
+class ResponseCache:
+    def __init__(self, maxsize=1024, ttl_seconds=3600):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'entries': len(self._entries)
+            }
+
+
+def conversation_cache_key(chain, prompt):
+    # A prompt asked with empty memory is context-free and shares one entry
+    # across users; otherwise the memory contents are part of the key
+    history = chain.memory.load_memory_variables({}).get(chain.memory.memory_key) if chain.memory else None
+    context = hashlib.sha1(str(history).encode()).hexdigest() if history else None
+    llm = chain.llm
+    return (
+        getattr(llm, 'model_name', type(llm).__name__),
+        getattr(llm, 'temperature', None),
+        normalize_prompt(prompt),
+        context
+    )
@@ -0,0 +1,87 @@
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from file_store import locked
+
+logger = logging.getLogger(__name__)
+
+
+# Cold storage for expired conversations: one gzip JSONL file per user.
+# Each append adds a new gzip member, which gzip readers concatenate.
+class ColdArchive:
+    def __init__(self, archive_dir="archive"):
+        self.archive_dir = archive_dir
+        os.makedirs(archive_dir, exist_ok=True)
+
+    def path(self, username):
+        key = hashlib.sha1(username.encode()).hexdigest()
+        return os.path.join(self.archive_dir, key + ".jsonl.gz")
+
+    def append(self, username, conversations):
+        archived_at = datetime.now().isoformat()
+        lines = "".join(
+            json.dumps({'username': username, 'archived_at': archived_at, 'conversation': conv}) + "\n"
+            for conv in conversations
+        )
+        path = self.path(username)
+        with locked(path):
+            with open(path, 'ab') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='ab') as f:
+                    f.write(lines.encode())
+                raw.flush()
+                os.fsync(raw.fileno())
+
+    def read(self, username):
+        try:
+            with gzip.open(self.path(username), 'rt') as f:
+                for line in f:
+                    record = json.loads(line)
+                    if record['username'] == username:
+                        yield record['conversation']
+        except FileNotFoundError:
+            return
+
+
+def run_retention(db, archive, now=None):
+    archived = db.expire_conversations(archive.append, now)
+    trimmed = db.trim_contexts(now)
+    return {'archived_conversations': archived, 'trimmed_topics': trimmed}
+
+
+def start_background_retention(db, archive, interval_seconds):
+    def loop():
+        while True:
+            try:
+                result = run_retention(db, archive)
+                logger.info("retention pass: %s", result)
+            except Exception:
+                logger.exception("retention pass failed")
+            time.sleep(interval_seconds)
+
+    thread = threading.Thread(target=loop, name="retention", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    from database import create_database
+
+    parser = argparse.ArgumentParser(description="Archive expired conversations and trim user context")
+    parser.add_argument("--archive-dir", default=os.getenv("ARCHIVE_DIR", "archive"))
+    parser.add_argument("--days", type=int, help="override RETENTION_DAYS for this run")
+    args = parser.parse_args()
+
+    db = create_database()
+    if args.days is not None:
+        db.retention_days = args.days
+    print(run_retention(db, ColdArchive(args.archive_dir)))
@@ -0,0 +1,351 @@
+import bisect
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import re
+import threading
+from array import array
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from chat_memory import estimate_tokens
+from file_store import atomic_write, locked
+from semantic_cache import HashingEmbedder
+
+logger = logging.getLogger(__name__)
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Question scaffolding, which carries no signal for ranking document chunks
+STOPWORDS = frozenset("""
+a an the is are was were be been am do does did what whats which who how why
+explain describe tell me about please can could would you your i to of in on
+for with give show define meaning mean means briefly simple simply terms
+""".split())
+
+
+def tokenize(text):
+    return [w for w in _TOKEN.findall(text.lower()) if w not in STOPWORDS]
+
+
+# BM25 over an in-memory inverted index of one user's document chunks, with
+# an optional dense index of hashed bag-of-words vectors.
+#
+# On disk, chunks.jsonl is the append-only source of truth: one line per
+# chunk, then {"end": digest} once a document is complete. index.npz is a
+# snapshot of the postings up to some offset in chunks.jsonl; anything after
+# it is replayed on load, and a document without its end line is cut off.
+# The snapshot is rewritten on a background thread once SNAPSHOT_CHUNKS
+# chunks are past it, so uploads and searches never wait for it.
+# Chunk text stays on disk and is read back only for the results.
+class DocumentIndex:
+    K1 = 1.5
+    B = 0.75
+    SNAPSHOT_CHUNKS = 1024
+
+    def __init__(self, directory, dense=False, dim=256):
+        self.directory = directory
+        self.chunks_path = os.path.join(directory, "chunks.jsonl")
+        self.snapshot_path = os.path.join(directory, "index.npz")
+        self.dense = dense
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._snapshotting = False
+        os.makedirs(directory, exist_ok=True)
+        with self._lock, locked(self.chunks_path):
+            self._reset()
+            self._load_snapshot()
+            self._replay()
+
+    def _reset(self):
+        self.documents = {}
+        self.offsets = array('q')
+        self.lengths = array('i')
+        self.total_length = 0
+        self.postings = {}
+        self.end_offset = 0
+        self.snapshot_count = 0
+        self.embedder = HashingEmbedder(self.dim, tokenize) if self.dense else None
+        self.vectors = np.zeros((0, self.dim), dtype=np.float32) if self.dense else None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _index_chunk(self, offset, text):
+        chunk_id = len(self.offsets)
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            entry = self.postings.get(term)
+            if entry is None:
+                entry = self.postings[term] = (array('i'), array('H'))
+            entry[0].append(chunk_id)
+            entry[1].append(min(tf, 65535))
+        self.offsets.append(offset)
+        length = sum(counts.values())
+        self.lengths.append(length)
+        self.total_length += length
+        if self.dense:
+            if chunk_id == len(self.vectors):
+                grown = np.zeros((max(64, 2 * len(self.vectors)), self.dim), dtype=np.float32)
+                grown[:chunk_id] = self.vectors
+                self.vectors = grown
+            self.vectors[chunk_id] = self.embedder.embed(text)
+
+    def _replay(self):
+        # Index whatever chunks.jsonl holds past the snapshot or last refresh
+        try:
+            f = open(self.chunks_path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(self.end_offset)
+            pending, offset = [], self.end_offset
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if 'end' in record:
+                    for chunk_offset, chunk in pending:
+                        self._index_chunk(chunk_offset, chunk['text'])
+                    self.documents[record['end']] = record.get('name')
+                    pending = []
+                    self.end_offset = offset + len(line)
+                else:
+                    pending.append((offset, record))
+                offset += len(line)
+        if offset > self.end_offset:
+            # A writer died mid-document; drop its partial lines
+            with open(self.chunks_path, 'r+b') as f:
+                f.truncate(self.end_offset)
+
+    def _load_snapshot(self):
+        try:
+            snapshot = np.load(self.snapshot_path, allow_pickle=False)
+        except (FileNotFoundError, OSError, ValueError):
+            return
+        with snapshot:
+            meta = json.loads(str(snapshot['meta']))
+            if meta.get('dense', False) != self.dense or meta.get('dim') != self.dim:
+                return
+            self.documents = meta['documents']
+            self.end_offset = meta['end_offset']
+            self.total_length = meta['total_length']
+            self.offsets = array('q', snapshot['offsets'].tobytes())
+            self.lengths = array('i', snapshot['lengths'].tobytes())
+            bounds = snapshot['term_bounds']
+            ids, tfs = snapshot['ids'], snapshot['tfs']
+            for i, term in enumerate(meta['terms']):
+                start, end = bounds[i], bounds[i + 1]
+                self.postings[term] = (array('i', ids[start:end].tobytes()), array('H', tfs[start:end].tobytes()))
+            if self.dense:
+                self.vectors = snapshot['vectors'].copy()
+            self.snapshot_count = len(self.offsets)
+
+    def _save_snapshot(self):
+        # Runs without self._lock, which is only held to read how far the
+        # index goes. Postings, offsets and lengths only ever grow at the end,
+        # so everything up to chunk n is fixed and is copied out while search
+        # and add_document carry on.
+        with self._lock:
+            n = len(self.offsets)
+            end_offset = self.end_offset
+            documents = dict(self.documents)
+            vectors = self.vectors
+        offsets, lengths = self.offsets[:n], self.lengths[:n]
+        terms, id_parts, tf_parts = [], [], []
+        for term, (term_ids, term_tfs) in list(self.postings.items()):
+            count = bisect.bisect_left(term_ids, n)
+            if count:
+                terms.append(term)
+                id_parts.append(np.frombuffer(term_ids[:count], dtype=np.int32))
+                tf_parts.append(np.frombuffer(term_tfs[:count], dtype=np.uint16))
+        bounds = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(part) for part in id_parts], out=bounds[1:])
+        ids = np.concatenate(id_parts) if id_parts else np.empty(0, dtype=np.int32)
+        tfs = np.concatenate(tf_parts) if tf_parts else np.empty(0, dtype=np.uint16)
+        lengths = np.frombuffer(lengths, dtype=np.int32)
+        total_length = int(lengths.sum())
+        meta = {'documents': documents, 'end_offset': end_offset,
+                'total_length': total_length, 'terms': terms, 'dense': self.dense, 'dim': self.dim}
+        arrays = {
+            'meta': np.array(json.dumps(meta)),
+            'offsets': np.frombuffer(offsets, dtype=np.int64),
+            'lengths': lengths,
+            'term_bounds': bounds, 'ids': ids, 'tfs': tfs
+        }
+        if self.dense:
+            arrays['vectors'] = vectors[:n]
+        atomic_write(self.snapshot_path, lambda f: np.savez(f, **arrays), mode='wb')
+        with self._lock:
+            self.snapshot_count = max(self.snapshot_count, n)
+
+    def _maybe_snapshot(self):
+        # Caller holds self._lock; at most one background snapshot at a time
+        if self._snapshotting or len(self.offsets) - self.snapshot_count < self.SNAPSHOT_CHUNKS:
+            return
+        self._snapshotting = True
+        threading.Thread(target=self._background_snapshot, name="retrieval-snapshot", daemon=True).start()
+
+    def _background_snapshot(self):
+        try:
+            with self._snapshot_lock:
+                self._save_snapshot()
+        except Exception as exc:
+            # chunks.jsonl still has everything; the next load replays more
+            logger.warning("snapshot of %s failed: %s", self.directory, exc)
+        finally:
+            with self._lock:
+                self._snapshotting = False
+
+    def add_document(self, digest, name, chunks, snapshot=True):
+        # Returns the number of chunks indexed; a known document adds nothing
+        with self._lock, locked(self.chunks_path):
+            self._replay()
+            if digest in self.documents:
+                return 0
+            buffer = io.BytesIO()
+            lines = []
+            for chunk in chunks:
+                line = (json.dumps({'doc': digest, 'name': name, 'page': chunk['page'],
+                                    'text': chunk['text']}) + "\n").encode()
+                lines.append((self.end_offset + buffer.tell(), chunk['text']))
+                buffer.write(line)
+            buffer.write((json.dumps({'end': digest, 'name': name}) + "\n").encode())
+            with open(self.chunks_path, 'ab') as f:
+                f.write(buffer.getvalue())
+                f.flush()
+                os.fsync(f.fileno())
+            for offset, text in lines:
+                self._index_chunk(offset, text)
+            self.documents[digest] = name
+            self.end_offset += buffer.tell()
+            if snapshot:
+                self._maybe_snapshot()
+            return len(lines)
+
+    def save(self):
+        # Writes a snapshot now, on the calling thread
+        with self._snapshot_lock:
+            self._save_snapshot()
+
+    def refresh(self):
+        # Picks up documents another process or index instance appended
+        try:
+            size = os.path.getsize(self.chunks_path)
+        except FileNotFoundError:
+            return
+        if size != self.end_offset:
+            with self._lock, locked(self.chunks_path):
+                self._replay()
+
+    def _bm25(self, terms, limit):
+        n = len(self.offsets)
+        lengths = np.frombuffer(self.lengths, dtype=np.int32)
+        norm = self.K1 * (1 - self.B + self.B * lengths / (self.total_length / n))
+        scores = np.zeros(n, dtype=np.float32)
+        for term in set(terms):
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            ids = np.frombuffer(entry[0], dtype=np.int32)
+            tf = np.frombuffer(entry[1], dtype=np.uint16).astype(np.float32)
+            idf = math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+            scores[ids] += idf * tf * (self.K1 + 1) / (tf + norm[ids])
+        return _top(scores, limit)
+
+    def _dense(self, query, limit):
+        vector = self.embedder.embed(query)
+        if not vector.any():
+            return []
+        return _top(self.vectors[:len(self.offsets)] @ vector, limit, minimum=0.1)
+
+    def search(self, query, k=4):
+        # [(chunk_id, score)], best first. With the dense index on, BM25 and
+        # vector rankings are merged by reciprocal rank fusion.
+        self.refresh()
+        terms = tokenize(query)
+        with self._lock:
+            if not terms or not self.offsets:
+                return []
+            lexical = self._bm25(terms, k if not self.dense else 4 * k)
+            if not self.dense:
+                return lexical
+            fused = {}
+            for ranking in (lexical, self._dense(query, 4 * k)):
+                for rank, (chunk_id, _) in enumerate(ranking):
+                    fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (60 + rank)
+            return sorted(fused.items(), key=lambda item: -item[1])[:k]
+
+    def read_chunks(self, chunk_ids):
+        with self._lock:
+            offsets = [self.offsets[i] for i in chunk_ids]
+        chunks = []
+        with open(self.chunks_path, 'rb') as f:
+            for offset in offsets:
+                f.seek(offset)
+                chunks.append(json.loads(f.readline()))
+        return chunks
+
+    def retrieve(self, query, k=4, max_tokens=1500):
+        # Top-k chunks that fit in max_tokens, in rank order
+        hits = self.search(query, k)
+        selected, used = [], 0
+        for (chunk_id, score), chunk in zip(hits, self.read_chunks([c for c, _ in hits])):
+            cost = estimate_tokens(chunk['text'])
+            if used + cost > max_tokens:
+                continue
+            chunk['score'] = float(score)
+            selected.append(chunk)
+            used += cost
+        return selected
+
+
+def _top(scores, limit, minimum=0.0):
+    candidates = np.flatnonzero(scores > minimum)
+    if len(candidates) > limit:
+        candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+    order = candidates[np.argsort(-scores[candidates], kind="stable")]
+    return [(int(i), float(scores[i])) for i in order]
+
+
+def format_context(chunks):
+    if not chunks:
+        return ""
+    excerpts = "\n\n".join(f"[{c['name']}, page {c['page']}]\n{c['text']}" for c in chunks)
+    return ("Excerpts from the user's uploaded files (use them only if relevant):\n\n"
+            f"{excerpts}\n\nUser message:")
+
+
+# Per-user indexes under one directory, with a bounded number kept loaded
+class IndexRegistry:
+    def __init__(self, base_dir, max_loaded=32, dense=False):
+        self.base_dir = base_dir
+        self.max_loaded = max_loaded
+        self.dense = dense
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def path(self, username):
+        return os.path.join(self.base_dir, hashlib.sha1(username.encode()).hexdigest())
+
+    def has_documents(self, username):
+        return os.path.exists(os.path.join(self.path(username), "chunks.jsonl"))
+
+    def get(self, username):
+        with self._lock:
+            index = self._indexes.get(username)
+            if index is not None:
+                self._indexes.move_to_end(username)
+                return index
+        index = DocumentIndex(self.path(username), dense=self.dense)
+        with self._lock:
+            index = self._indexes.setdefault(username, index)
+            self._indexes.move_to_end(username)
+            while len(self._indexes) > self.max_loaded:
+                self._indexes.popitem(last=False)
+            return index
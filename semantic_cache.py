@@ -0,0 +1,175 @@
+import hashlib
+import re
+import threading
+
+import numpy as np
+
+# Words (keeping "c++" and "c#" whole), numbers, and operator or symbol
+# characters; sentence punctuation is dropped
+_TOKEN = re.compile(r"[a-z][a-z0-9_]*(?:\+\+|#)?|\d+(?:\.\d+)?|[^\w\s?!.,;:'\"]")
+
+# Ways of asking the same kind of question, rewritten to one word before
+# tokenizing: "what is python" and "explain python to me" both become
+# "explain python". "why" and "how does ... work" keep their own words.
+INTENTS = (
+    (re.compile(r"\b(?:how (?:do|can|could|should|would) (?:i|you|we|one)|how to|"
+                r"what(?:'s| is) the (?:best |easiest |right )?way to|(?:best |easiest )?ways? to)\b"), " how "),
+    (re.compile(r"\b(?:what(?:'s| is| are)|what do you know about|tell me about|tell me|explain|describe|"
+                r"define|definition of|meaning of|give me an overview of|overview of|introduction to)\b"), " explain "),
+    (re.compile(r"\b(?:differences? between|compare|comparison of|versus|vs)\b"), " compare "),
+    (re.compile(r"\b(?:can't|cannot)\b"), "can not"),
+    (re.compile(r"\bwon't\b"), "will not"),
+    (re.compile(r"n't\b"), " not"),
+)
+
+# Filler that does not change what is being asked
+STOPWORDS = frozenset("""
+a an the is are was were be been am do does did can could would will shall should
+please kindly just really actually exactly briefly simply some any
+you your i me my we our us to of in on for with about it its this that there
+and or then so hey
+""".split())
+
+# Words that flip or redirect a question; like numbers and symbols they must
+# match exactly. "to" and "into" mark a direction, so "convert string to
+# int" records "to:int" and never meets "convert int to string".
+NEGATIONS = frozenset("not no never without".split())
+DIRECTIONS = frozenset("to into".split())
+ARTICLES = frozenset("a an the".split())
+
+
+def stem(word):
+    # Plural and third-person "s" only: "lists"/"list", "works"/"work"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    text = text.lower().replace("\u2019", "'")
+    for pattern, replacement in INTENTS:
+        text = pattern.sub(replacement, text)
+    tokens, direction = [], None
+    for word in _TOKEN.findall(text):
+        if word in DIRECTIONS:
+            direction = word
+            continue
+        if word in ARTICLES:
+            continue
+        if word not in STOPWORDS:
+            word = stem(word) if word.isalpha() else word
+            tokens.append(word)
+            if direction and word.isalpha():
+                tokens.append("to:" + word)
+        direction = None
+    return tokens
+
+
+def literals(tokens):
+    # Numbers, symbol-bearing tokens, negations and directions, in order:
+    # "3+5" and "3*5", "c" and "c++", or "why is x slow" and "why is x not
+    # slow" must never share an answer however close their vectors are
+    return tuple(t for t in tokens if not t.isalpha() or t in NEGATIONS)
+
+
+# Local bag-of-words embedding via signed feature hashing; no model download
+# and no network. Unigrams and, by default, bigrams of content words,
+# L2-normalized.
+class HashingEmbedder:
+    def __init__(self, dim=512, tokenize=tokenize, bigrams=True):
+        self.dim = dim
+        self.tokenize = tokenize
+        self.bigrams = bigrams
+
+    def features(self, text):
+        words = self.tokenize(text)
+        if not self.bigrams:
+            return words
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self.features(text):
+            h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+            vector[h % self.dim] += 1.0 if (h >> 63) else -1.0
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector
+
+
+# Nearest-neighbour response cache over a preallocated vector matrix.
+# Lookups only match entries from the same partition (model, temperature and
+# conversation context), and the least recently used slot is reused when full.
+# Word order is left to the literal guard, so the default embedder has no
+# bigrams: "reverse a python list" and "reverse a list in python" match.
+# benchmarks/check_semantic_cache.py holds the pairs the threshold is tuned on.
+class SemanticCache:
+    def __init__(self, capacity=10000, threshold=0.8, embedder=None):
+        self.embedder = embedder or HashingEmbedder(bigrams=False)
+        self.capacity = capacity
+        self.threshold = threshold
+        self.vectors = np.zeros((capacity, self.embedder.dim), dtype=np.float32)
+        self.partitions = np.zeros(capacity, dtype=np.int64)
+        self.literals = np.zeros(capacity, dtype=np.int64)
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.responses = [None] * capacity
+        self.size = 0
+        self._clock = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def partition_id(partition):
+        digest = hashlib.blake2b(repr(partition).encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "little", signed=True)
+
+    def lookup(self, partition, prompt):
+        vector = self.embedder.embed(prompt)
+        if not vector.any():
+            return None
+        pid = self.partition_id(partition)
+        lid = self.partition_id(literals(tokenize(prompt)))
+        with self._lock:
+            if self.size:
+                scores = self.vectors[:self.size] @ vector
+                scores[(self.partitions[:self.size] != pid) | (self.literals[:self.size] != lid)] = -1.0
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._clock += 1
+                    self.last_used[best] = self._clock
+                    self.hits += 1
+                    return self.responses[best]
+            self.misses += 1
+            return None
+
+    def add(self, partition, prompt, response):
+        vector = self.embedder.embed(prompt)
+        if not vector.any():
+            return
+        with self._lock:
+            if self.size < self.capacity:
+                slot = self.size
+                self.size += 1
+            else:
+                slot = int(np.argmin(self.last_used))
+                self.evictions += 1
+            self._clock += 1
+            self.vectors[slot] = vector
+            self.partitions[slot] = self.partition_id(partition)
+            self.literals[slot] = self.partition_id(literals(tokenize(prompt)))
+            self.last_used[slot] = self._clock
+            self.responses[slot] = response
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': self.size
+            }
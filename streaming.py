@@ -0,0 +1,80 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def build_prompt(chain, user_input, context=""):
+    # `context` (e.g. retrieved document excerpts) goes in front of this turn's
+    # input for the model only; memory keeps the plain message
+    text = f"{context}\n{user_input}" if context else user_input
+    inputs = chain.prep_inputs({chain.input_key: text})
+    return chain.prompt.format_prompt(
+        **{k: inputs[k] for k in chain.prompt.input_variables}
+    )
+
+
+def complete_reply(chain, user_input, context=""):
+    # Non-streaming counterpart of StreamedReply
+    message = chain.llm.invoke(build_prompt(chain, user_input, context), **chain.llm_kwargs)
+    chain.memory.save_context(
+        {chain.input_key: user_input},
+        {chain.output_key: message.content}
+    )
+    return message.content
+
+
+# Streams one ConversationChain turn token by token.
+# Iterate it (e.g. with st.write_stream) to get text chunks; once the stream
+# ends the full reply is saved to the chain's memory and `text` / `stats`
+# are filled in.
+class StreamedReply:
+    def __init__(self, chain, user_input, context=""):
+        self.chain = chain
+        self.user_input = user_input
+        self.context = context
+        self.text = None
+        self.stats = None
+        # Set once the first token has been yielded
+        self.started = False
+
+    def __iter__(self):
+        chain = self.chain
+        prompt = build_prompt(chain, self.user_input, self.context)
+
+        start = time.perf_counter()
+        first_token_at = None
+        chunks = []
+        usage = None
+        for chunk in chain.llm.stream(prompt, **chain.llm_kwargs):
+            if chunk.content:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    self.started = True
+                chunks.append(chunk.content)
+                yield chunk.content
+            if getattr(chunk, 'usage_metadata', None):
+                usage = chunk.usage_metadata
+        end = time.perf_counter()
+
+        self.text = "".join(chunks)
+        chain.memory.save_context(
+            {chain.input_key: self.user_input},
+            {chain.output_key: self.text}
+        )
+
+        # Provider usage counts when available, otherwise streamed chunks
+        tokens = usage['output_tokens'] if usage else len(chunks)
+        ttft = (first_token_at or end) - start
+        generation = end - (first_token_at or end)
+        self.stats = {
+            'time_to_first_token': ttft,
+            'total_time': end - start,
+            'output_tokens': tokens,
+            'tokens_per_second': tokens / generation if generation > 0 else 0.0
+        }
+        logger.info(
+            "streamed reply: ttft=%.3fs total=%.3fs tokens=%d tok/s=%.1f",
+            self.stats['time_to_first_token'], self.stats['total_time'],
+            tokens, self.stats['tokens_per_second']
+        )
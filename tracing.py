@@ -0,0 +1,194 @@
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+from file_store import atomic_write
+
+# TRACING=1 turns spans on. When it is off, span() hands back one shared
+# no-op context manager and traced()/instrument() leave functions untouched,
+# so the instrumented code pays one function call or nothing at all.
+ENABLED = os.getenv("TRACING", "0").lower() in ("1", "true", "yes")
+# One JSON line per span, written when the outermost span of a thread ends
+TRACE_LOG_FILE = os.getenv("TRACE_LOG_FILE") or None
+
+# Upper bounds in seconds, as in a Prometheus histogram
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_NOOP = nullcontext()
+_local = threading.local()
+_trace_ids = itertools.count(1)
+_lock = threading.Lock()
+_log_lock = threading.Lock()
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        i = 0
+        while i < len(BUCKETS) and seconds > BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q):
+        # Linear interpolation inside the bucket holding the q-th observation
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-1]
+
+
+_histograms = {}
+
+
+def record(name, seconds):
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+
+class _Span:
+    __slots__ = ("name", "start", "parent")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+            _local.pending = []
+        if not stack:
+            _local.trace = next(_trace_ids)
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        stack = _local.stack
+        stack.pop()
+        record(self.name, seconds)
+        if TRACE_LOG_FILE:
+            _local.pending.append({'ts': time.time(), 'trace': _local.trace, 'span': self.name,
+                                   'parent': self.parent, 'seconds': round(seconds, 6)})
+            if not stack:
+                lines = "".join(json.dumps(entry) + "\n" for entry in _local.pending)
+                _local.pending = []
+                with _log_lock, open(TRACE_LOG_FILE, 'a') as f:
+                    f.write(lines)
+        return False
+
+
+def span(name):
+    if not ENABLED:
+        return _NOOP
+    return _Span(name)
+
+
+def traced(name):
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def instrument(cls, method_names, prefix):
+    # Wraps methods defined on cls itself; inherited ones are wrapped where
+    # they are defined
+    for method_name in method_names:
+        if method_name in vars(cls):
+            setattr(cls, method_name, traced(prefix + method_name)(vars(cls)[method_name]))
+
+
+def stats():
+    with _lock:
+        return {
+            name: {'count': h.count, 'total': h.total, 'mean': h.total / h.count,
+                   'p50': h.quantile(0.5), 'p95': h.quantile(0.95), 'p99': h.quantile(0.99)}
+            for name, h in sorted(_histograms.items())
+        }
+
+
+# Cache name -> its stats() method. Caches count hits whether or not
+# tracing is on, so they are exported either way.
+_caches = {}
+COUNTERS = ("hits", "misses", "evictions", "expirations")
+
+
+def register_cache(name, stats):
+    _caches[name] = stats
+
+
+def cache_stats():
+    return {name: stats() for name, stats in sorted(_caches.items())}
+
+
+def prometheus_text():
+    lines = ["# HELP iyyappan_span_seconds Time spent in instrumented code paths.",
+             "# TYPE iyyappan_span_seconds histogram"]
+    with _lock:
+        for name, h in sorted(_histograms.items()):
+            label = name.replace("\\", "\\\\").replace('"', '\\"')
+            cumulative = 0
+            for bound, n in zip(BUCKETS + ("+Inf",), h.counts):
+                cumulative += n
+                lines.append(f'iyyappan_span_seconds_bucket{{span="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'iyyappan_span_seconds_sum{{span="{label}"}} {h.total:.6f}')
+            lines.append(f'iyyappan_span_seconds_count{{span="{label}"}} {h.count}')
+    metrics = {}
+    for name, stats in cache_stats().items():
+        for metric, value in stats.items():
+            metrics.setdefault(metric, []).append((name, value))
+    for metric, values in metrics.items():
+        kind = "counter" if metric in COUNTERS else "gauge"
+        full = f"iyyappan_cache_{metric}" + ("_total" if kind == "counter" else "")
+        lines.append(f"# TYPE {full} {kind}")
+        lines.extend(f'{full}{{cache="{name}"}} {value:g}' for name, value in values)
+    return "\n".join(lines) + "\n"
+
+
+_last_export = 0.0
+
+
+def write_prometheus(path, min_interval=0.0):
+    # For the node_exporter textfile collector; replaced atomically and at
+    # most once per min_interval seconds
+    global _last_export
+    now = time.monotonic()
+    with _lock:
+        if now - _last_export < min_interval:
+            return
+        _last_export = now
+    text = prometheus_text()
+    atomic_write(path, lambda f: f.write(text))
+
+
+def reset():
+    with _lock:
+        _histograms.clear()